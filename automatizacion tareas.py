@@ -2,14 +2,97 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import os
 import shutil
-import hashlib
 import threading
-import subprocess
+import queue
+from collections import deque
 import sys
 from datetime import datetime
 import json
 import webbrowser
 
+from autotask_engine import (run_task, TaskContext, TaskManager, TempMatcher, TASKS, HASH_ALGORITHMS,
+                             DEFAULT_WORKERS, HASH_CACHE_FILE, TEMP_EXTENSIONS, CLEAN_PRUNE_DIRS,
+                             DEDUPE_MODES, format_progress)
+from autotask_watch import FolderWatcher, WATCH_ACTIONS
+from autotask_scripts import ScriptScheduler, ScriptJob, PythonWorkerPool, find_autohotkey
+from autotask_pipeline import Pipeline
+from autotask_index import FolderIndex, IndexStore, INDEX_DIR, format_preview
+
+# Colores de los tipos de mensaje del registro
+LOG_COLORS = {
+    "info": "#3498db",
+    "success": "#2ecc71",
+    "warning": "#f39c12",
+    "error": "#e74c3c",
+}
+# Intervalo de volcado del registro (ms) y mensajes máximos por lote
+LOG_FLUSH_INTERVAL = 100
+LOG_MAX_BATCH = 5000
+# Líneas visibles y retenidas en memoria; el historial completo va a disco
+LOG_MAX_LINES = 5000
+LOG_FILE = "autotask_activity.log"
+# Nombres visibles de los modos de duplicados
+DEDUPE_MODE_LABELS = {
+    'delete': "Eliminar",
+    'hardlink': "Enlace duro",
+    'reflink': "Reflink (copia CoW)",
+}
+# Métricas de cada tarea (una línea JSON por ejecución), junto al registro
+METRICS_FILE = "autotask_metrics.jsonl"
+# Espera (ms) tras mostrar la ventana antes de cargar el índice de la carpeta
+INDEX_LOAD_DELAY = 500
+
+
+class ActivityLogFile:
+    """Historial del registro en disco con rotación por tamaño"""
+    
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backup_count=5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.lock = threading.Lock()
+        self.file = open(path, 'a', encoding='utf-8')
+        # Posición donde comienza la sesión actual y rotaciones desde entonces
+        self.session_start = self.file.tell()
+        self.rotations = 0
+    
+    def write(self, text):
+        """Agrega texto al historial, rotando el archivo si supera el tamaño máximo"""
+        with self.lock:
+            self.file.write(text)
+            self.file.flush()
+            if self.file.tell() >= self.max_bytes:
+                self._rotate()
+    
+    def _rotate(self):
+        self.file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{i}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+        self.file = open(self.path, 'w', encoding='utf-8')
+        self.rotations += 1
+    
+    def copy_session(self, destination):
+        """Copia por bloques el historial de la sesión actual a un archivo binario abierto"""
+        with self.lock:
+            self.file.flush()
+            # Archivos rotados más antiguos primero y por último el actual
+            parts = [(f"{self.path}.{i}", i == self.rotations)
+                     for i in range(min(self.rotations, self.backup_count), 0, -1)]
+            parts.append((self.path, self.rotations == 0))
+            for path, is_session_start in parts:
+                with open(path, 'rb') as f:
+                    if is_session_start:
+                        f.seek(self.session_start)
+                    shutil.copyfileobj(f, destination)
+    
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
 class TaskAutomationApp:
     def __init__(self, root):
         self.root = root
@@ -23,16 +106,86 @@ class TaskAutomationApp:
         
         # Variables
         self.selected_folder = tk.StringVar()
-        self.task_in_progress = False
+        self.tasks = TaskManager()
+        self.latest_progress = None
         self.config_file = "autotask_config.json"
         self.saved_scripts = []
+        self.pipeline_state = {}
+        self.pipeline_parallel = 4
+        self.log_queue = queue.Queue()
+        self.log_buffer = deque(maxlen=LOG_MAX_LINES)
+        self.hash_algorithm = tk.StringVar(value="md5")
+        self.hash_workers = DEFAULT_WORKERS
+        self.move_workers = DEFAULT_WORKERS
+        self.use_hash_cache = True
+        self.dedupe_recursive = tk.BooleanVar(value=False)
+        self.dedupe_verify = tk.BooleanVar(value=False)
+        self.dedupe_mode = tk.StringVar(value=DEDUPE_MODE_LABELS['delete'])
+        self.dry_run = tk.BooleanVar(value=False)
+        self.watcher = None
+        self.script_concurrency = 2
+        self.script_timeout = 300
+        self.script_output_lines = 1000
+        self.python_warm_pool = False
+        self.python_pool_size = 2
+        self.python_preload = []
+        self.python_worker_max_runs = 50
+        self.watch_actions = list(WATCH_ACTIONS)
+        self.watch_interval = 2.0
+        self.dedupe_include = []
+        self.dedupe_exclude = []
+        self.dedupe_max_depth = None
+        self.clean_extensions = list(TEMP_EXTENSIONS)
+        self.clean_patterns = []
+        self.clean_min_age_days = None
+        self.clean_min_size = None
+        self.clean_max_size = None
+        self.clean_prune = list(CLEAN_PRUNE_DIRS)
+        self.clean_workers = 1
+        self.task_metrics = True
+        self.task_profile = False
+        self.folder_index = True
+        self.undo_journal = True
+        self.index_thread = None
+        self.index_pending = False
+        self.index_tasks = 0
+        self.latest_preview = None
+        self.hash_cache_file = os.path.join(os.path.dirname(os.path.abspath(self.config_file)),
+                                            HASH_CACHE_FILE)
         
         # Cargar configuración
         self.load_config()
         
+        # Historial completo del registro en disco
+        try:
+            self.activity_log = ActivityLogFile(
+                os.path.join(os.path.dirname(os.path.abspath(self.config_file)), LOG_FILE))
+        except Exception:
+            self.activity_log = None
+        
+        # Planificador de scripts (opcionalmente con procesos Python precargados)
+        self.python_pool = None
+        if self.python_warm_pool:
+            self.python_pool = PythonWorkerPool(size=self.python_pool_size, preload=self.python_preload,
+                                                max_runs=self.python_worker_max_runs)
+        self.scripts = ScriptScheduler(
+            max_concurrent=self.script_concurrency, max_output_lines=self.script_output_lines,
+            python_pool=self.python_pool, ctx=TaskContext(log=self.update_log)
+        )
+        
+        # Índices de las carpetas recientes para la vista previa
+        self.index_store = IndexStore(os.path.join(os.path.dirname(os.path.abspath(self.config_file)),
+                                                   INDEX_DIR))
+        
         # Crear interfaz
         self.create_widgets()
         
+        # Volcar el registro periódicamente desde el hilo de la interfaz
+        self.root.after(LOG_FLUSH_INTERVAL, self.flush_log)
+        
+        # Cargar el índice cuando la ventana ya está visible
+        self.root.after(INDEX_LOAD_DELAY, self.load_index)
+        
         # Actualizar log
         self.update_log("AutoTask iniciado. Seleccione una carpeta y una tarea.")
         self.update_log(f"Carpeta predefinida: {self.selected_folder.get()}")
@@ -63,6 +216,41 @@ class TaskAutomationApp:
                     config = json.load(f)
                     self.selected_folder.set(config.get('last_folder', ''))
                     self.saved_scripts = config.get('saved_scripts', [])
+                    self.pipeline_state = config.get('pipeline_state', {})
+                    self.pipeline_parallel = max(1, int(config.get('pipeline_parallel', 4)))
+                    if config.get('hash_algorithm') in HASH_ALGORITHMS:
+                        self.hash_algorithm.set(config['hash_algorithm'])
+                    self.hash_workers = max(1, int(config.get('hash_workers', DEFAULT_WORKERS)))
+                    self.move_workers = max(1, int(config.get('move_workers', DEFAULT_WORKERS)))
+                    self.use_hash_cache = bool(config.get('hash_cache', True))
+                    self.dedupe_recursive.set(bool(config.get('dedupe_recursive', False)))
+                    self.dedupe_verify.set(bool(config.get('dedupe_verify', False)))
+                    if config.get('dedupe_mode') in DEDUPE_MODES:
+                        self.dedupe_mode.set(DEDUPE_MODE_LABELS[config['dedupe_mode']])
+                    self.dedupe_include = config.get('dedupe_include', [])
+                    self.dedupe_exclude = config.get('dedupe_exclude', [])
+                    self.dedupe_max_depth = config.get('dedupe_max_depth')
+                    self.clean_extensions = config.get('clean_extensions', list(TEMP_EXTENSIONS))
+                    self.clean_patterns = config.get('clean_patterns', [])
+                    self.clean_min_age_days = config.get('clean_min_age_days')
+                    self.clean_min_size = config.get('clean_min_size')
+                    self.clean_max_size = config.get('clean_max_size')
+                    self.clean_prune = config.get('clean_prune', list(CLEAN_PRUNE_DIRS))
+                    self.clean_workers = max(1, int(config.get('clean_workers', 1)))
+                    self.task_metrics = bool(config.get('task_metrics', True))
+                    self.task_profile = bool(config.get('task_profile', False))
+                    self.folder_index = bool(config.get('folder_index', True))
+                    self.undo_journal = bool(config.get('undo_journal', True))
+                    self.watch_actions = [a for a in config.get('watch_actions', WATCH_ACTIONS)
+                                          if a in WATCH_ACTIONS]
+                    self.watch_interval = float(config.get('watch_interval', 2.0))
+                    self.script_concurrency = max(1, int(config.get('script_concurrency', 2)))
+                    self.script_timeout = float(config.get('script_timeout', 300))
+                    self.script_output_lines = int(config.get('script_output_lines', 1000))
+                    self.python_warm_pool = bool(config.get('python_warm_pool', False))
+                    self.python_pool_size = max(1, int(config.get('python_pool_size', 2)))
+                    self.python_preload = config.get('python_preload', [])
+                    self.python_worker_max_runs = int(config.get('python_worker_max_runs', 50))
             except:
                 # Si hay error, usar valores por defecto
                 self.selected_folder.set(os.path.expanduser("~/Documents"))
@@ -74,7 +262,39 @@ class TaskAutomationApp:
         """Guarda la configuración en el archivo JSON"""
         config = {
             'last_folder': self.selected_folder.get(),
-            'saved_scripts': self.saved_scripts
+            'saved_scripts': self.saved_scripts,
+            'pipeline_state': self.pipeline_state,
+            'pipeline_parallel': self.pipeline_parallel,
+            'hash_algorithm': self.hash_algorithm.get(),
+            'hash_workers': self.hash_workers,
+            'move_workers': self.move_workers,
+            'hash_cache': self.use_hash_cache,
+            'dedupe_recursive': self.dedupe_recursive.get(),
+            'dedupe_verify': self.dedupe_verify.get(),
+            'dedupe_mode': self.selected_dedupe_mode(),
+            'dedupe_include': self.dedupe_include,
+            'dedupe_exclude': self.dedupe_exclude,
+            'dedupe_max_depth': self.dedupe_max_depth,
+            'clean_extensions': self.clean_extensions,
+            'clean_patterns': self.clean_patterns,
+            'clean_min_age_days': self.clean_min_age_days,
+            'clean_min_size': self.clean_min_size,
+            'clean_max_size': self.clean_max_size,
+            'clean_prune': self.clean_prune,
+            'clean_workers': self.clean_workers,
+            'task_metrics': self.task_metrics,
+            'task_profile': self.task_profile,
+            'folder_index': self.folder_index,
+            'undo_journal': self.undo_journal,
+            'watch_actions': self.watch_actions,
+            'watch_interval': self.watch_interval,
+            'script_concurrency': self.script_concurrency,
+            'script_timeout': self.script_timeout,
+            'script_output_lines': self.script_output_lines,
+            'python_warm_pool': self.python_warm_pool,
+            'python_pool_size': self.python_pool_size,
+            'python_preload': self.python_preload,
+            'python_worker_max_runs': self.python_worker_max_runs
         }
         with open(self.config_file, 'w') as f:
             json.dump(config, f, indent=4)
@@ -107,6 +327,8 @@ class TaskAutomationApp:
         
         ttk.Button(folder_frame, text="Examinar", command=self.browse_folder, style="Action.TButton").grid(
             row=0, column=1, padx=(5, 0))
+        self.preview_label = ttk.Label(folder_frame, text="", wraplength=650)
+        self.preview_label.grid(row=1, column=0, columnspan=2, sticky=tk.W, pady=(5, 0))
         
         # Separador
         separator = ttk.Separator(main_frame, orient='horizontal')
@@ -136,6 +358,52 @@ class TaskAutomationApp:
         ttk.Button(task_frame, text="Ejecutar Script AHK", command=self.run_ahk_script, 
                   style="Action.TButton").grid(row=1, column=2, padx=5, pady=5, sticky=(tk.W, tk.E))
         
+        # Tercera fila de botones
+        self.watch_button = ttk.Button(task_frame, text="Vigilar Carpeta", command=self.toggle_watch,
+                                       style="Action.TButton")
+        self.watch_button.grid(row=2, column=0, padx=5, pady=5, sticky=(tk.W, tk.E))
+        ttk.Button(task_frame, text="Detener Scripts", command=self.stop_scripts,
+                  style="Action.TButton").grid(row=2, column=1, padx=5, pady=5, sticky=(tk.W, tk.E))
+        ttk.Button(task_frame, text="Ejecutar Pipeline", command=self.run_pipeline,
+                  style="Action.TButton").grid(row=2, column=2, padx=5, pady=5, sticky=(tk.W, tk.E))
+        
+        # Cuarta fila de botones
+        ttk.Button(task_frame, text="Deshacer Última Ejecución", command=self.undo_last_run,
+                  style="Action.TButton").grid(row=3, column=0, padx=5, pady=5, sticky=(tk.W, tk.E))
+        ttk.Button(task_frame, text="Historial de Scripts", command=self.show_script_history,
+                  style="Action.TButton").grid(row=3, column=1, padx=5, pady=5, sticky=(tk.W, tk.E))
+        
+        # Opciones de las tareas
+        options_frame = ttk.Frame(task_frame)
+        options_frame.grid(row=4, column=0, columnspan=3, sticky=tk.W, padx=5, pady=5)
+        
+        ttk.Label(options_frame, text="Algoritmo de hash:").grid(row=0, column=0, padx=(0, 5))
+        ttk.Combobox(options_frame, textvariable=self.hash_algorithm, values=HASH_ALGORITHMS,
+                     state="readonly", width=10).grid(row=0, column=1, padx=(0, 15))
+        ttk.Checkbutton(options_frame, text="Duplicados en subcarpetas",
+                        variable=self.dedupe_recursive, command=self.load_index).grid(row=0, column=2, padx=(0, 15))
+        ttk.Checkbutton(options_frame, text="Verificar byte a byte",
+                        variable=self.dedupe_verify).grid(row=0, column=3, padx=(0, 15))
+        ttk.Checkbutton(options_frame, text="Simulación (sin cambios)",
+                        variable=self.dry_run).grid(row=0, column=4, padx=(0, 15))
+        ttk.Label(options_frame, text="Duplicados:").grid(row=1, column=0, padx=(0, 5), pady=(5, 0),
+                                                         sticky=tk.W)
+        ttk.Combobox(options_frame, textvariable=self.dedupe_mode,
+                     values=list(DEDUPE_MODE_LABELS.values()), state="readonly",
+                     width=18).grid(row=1, column=1, columnspan=2, pady=(5, 0), sticky=tk.W)
+        
+        # Progreso de las tareas en curso
+        progress_frame = ttk.Frame(task_frame)
+        progress_frame.grid(row=5, column=0, columnspan=3, sticky=(tk.W, tk.E), padx=5, pady=5)
+        progress_frame.columnconfigure(0, weight=1)
+        
+        self.progress_bar = ttk.Progressbar(progress_frame, mode='determinate', maximum=100)
+        self.progress_bar.grid(row=0, column=0, sticky=(tk.W, tk.E), padx=(0, 10))
+        ttk.Button(progress_frame, text="Cancelar Tarea", command=self.cancel_tasks,
+                  style="Danger.TButton").grid(row=0, column=1)
+        self.progress_label = ttk.Label(progress_frame, text="")
+        self.progress_label.grid(row=1, column=0, columnspan=2, sticky=tk.W)
+        
         # Configurar expansión uniforme de columnas
         for i in range(3):
             task_frame.columnconfigure(i, weight=1)
@@ -159,6 +427,8 @@ class TaskAutomationApp:
             font=('Consolas', 10), bg='#2c3e50', fg='#ecf0f1', insertbackground='white'
         )
         self.log_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        for tag, color in LOG_COLORS.items():
+            self.log_text.tag_config(tag, foreground=color)
         
         # Botones de control
         control_frame = ttk.Frame(main_frame)
@@ -176,46 +446,77 @@ class TaskAutomationApp:
                   style="Danger.TButton").grid(row=0, column=4, padx=5)
     
     def update_log(self, message, message_type="info"):
-        """Agrega un mensaje al registro con formato de colores"""
+        """Encola un mensaje para el registro (seguro desde cualquier hilo)"""
         timestamp = datetime.now().strftime("%H:%M:%S")
+        tag = message_type if message_type in LOG_COLORS else "info"
+        self.log_queue.put((timestamp, message, tag))
+    
+    def flush_log(self):
+        """Vuelca periódicamente los mensajes encolados al área de registro"""
+        self.drain_log()
+        self.update_progress()
+        self.update_preview()
+        self.root.after(LOG_FLUSH_INTERVAL, self.flush_log)
+    
+    def drain_log(self):
+        """Vuelca en lotes los mensajes encolados al historial y al área de registro"""
+        records = []
+        try:
+            for _ in range(LOG_MAX_BATCH):
+                records.append(self.log_queue.get_nowait())
+        except queue.Empty:
+            pass
+        
+        if not records:
+            return
         
-        # Asignar color según el tipo de mensaje
-        if message_type == "error":
-            tag = "error"
-            self.log_text.tag_config(tag, foreground="#e74c3c")
-        elif message_type == "success":
-            tag = "success"
-            self.log_text.tag_config(tag, foreground="#2ecc71")
-        elif message_type == "warning":
-            tag = "warning"
-            self.log_text.tag_config(tag, foreground="#f39c12")
-        else:
-            tag = "info"
-            self.log_text.tag_config(tag, foreground="#3498db")
-        
-        # Insertar mensaje
-        self.log_text.insert(tk.END, f"[{timestamp}] ", "timestamp")
-        self.log_text.insert(tk.END, f"{message}\n", tag)
-        
-        # Auto-scroll al final
+        # Historial completo en disco
+        if self.activity_log:
+            try:
+                self.activity_log.write("".join(
+                    f"[{timestamp}] {message}\n" for timestamp, message, tag in records))
+            except Exception:
+                self.activity_log = None
+        
+        # Solo las últimas LOG_MAX_LINES entradas se mantienen en memoria y en pantalla
+        self.log_buffer.extend(records)
+        if len(records) >= self.log_buffer.maxlen:
+            self.log_text.delete(1.0, tk.END)
+            records = self.log_buffer
+        
+        chunks = []
+        for timestamp, message, tag in records:
+            chunks.extend((f"[{timestamp}] ", "timestamp", f"{message}\n", tag))
+        
+        # Una sola inserción y un solo desplazamiento por lote
+        self.log_text.insert(tk.END, *chunks)
+        excess = int(self.log_text.index('end-1c').split('.')[0]) - 1 - LOG_MAX_LINES
+        if excess > 0:
+            self.log_text.delete(1.0, f"{excess + 1}.0")
         self.log_text.see(tk.END)
-        self.root.update_idletasks()
     
     def clear_log(self):
-        """Limpia el área de registro"""
+        """Limpia el área de registro (el historial en disco se conserva)"""
         self.log_text.delete(1.0, tk.END)
+        self.log_buffer.clear()
         self.update_log("Log limpiado.")
     
     def save_log(self):
-        """Guarda el registro en un archivo"""
+        """Guarda el registro de la sesión en un archivo"""
         file_path = filedialog.asksaveasfilename(
             defaultextension=".log",
             filetypes=[("Archivos de log", "*.log"), ("Todos los archivos", "*.*")]
         )
         if file_path:
             try:
-                with open(file_path, 'w') as f:
-                    f.write(self.log_text.get(1.0, tk.END))
+                self.drain_log()
+                if self.activity_log:
+                    # Copiar el historial desde disco sin cargarlo en memoria
+                    with open(file_path, 'wb') as f:
+                        self.activity_log.copy_session(f)
+                else:
+                    with open(file_path, 'w') as f:
+                        f.write(self.log_text.get(1.0, tk.END))
                 self.update_log(f"Log guardado en: {file_path}", "success")
             except Exception as e:
                 self.update_log(f"Error guardando log: {str(e)}", "error")
@@ -227,6 +528,7 @@ class TaskAutomationApp:
             self.selected_folder.set(folder_path)
             self.update_log(f"Carpeta seleccionada: {folder_path}")
             self.save_config()
+            self.load_index()
     
     def open_folder(self):
         """Abre la carpeta seleccionada en el explorador de archivos"""
@@ -242,10 +544,106 @@ class TaskAutomationApp:
         webbrowser.open("https://github.com")
         self.update_log("Navegador abierto hacia GitHub")
     
+    def set_progress(self, progress):
+        """Guarda el último progreso publicado (se llama desde los hilos de las tareas)"""
+        self.latest_progress = progress
+    
+    def update_progress(self):
+        """Refleja en la barra el último progreso de las tareas en curso"""
+        tasks = self.tasks.active_tasks()
+        progress = self.latest_progress
+        if not tasks or progress is None:
+            if not tasks:
+                self.latest_progress = None
+            self.progress_bar.configure(mode='determinate', value=0)
+            self.progress_label.configure(
+                text=f"{len(tasks)} tareas en curso" if tasks else "")
+            return
+        if progress.total:
+            self.progress_bar.configure(mode='determinate',
+                                        value=100.0 * progress.done / progress.total)
+        else:
+            self.progress_bar.configure(mode='indeterminate')
+            self.progress_bar.step(2)
+        text = format_progress(progress)
+        if len(tasks) > 1:
+            text += f" ({len(tasks)} tareas en curso)"
+        self.progress_label.configure(text=text)
+    
+    def load_index(self):
+        """Actualiza en segundo plano el índice de la carpeta seleccionada"""
+        folder = self.selected_folder.get()
+        if not self.folder_index or not folder or not os.path.isdir(folder):
+            return
+        if self.index_thread and self.index_thread.is_alive():
+            self.index_pending = True
+            return
+        # Las opciones se leen aquí: las variables de Tk solo se usan desde este hilo
+        options = {
+            'recursive': self.dedupe_recursive.get(),
+            'matcher': TempMatcher(self.clean_extensions, self.clean_patterns, self.clean_min_age_days,
+                                   self.clean_min_size, self.clean_max_size),
+            'prune': self.clean_prune
+        }
+        self.index_thread = threading.Thread(target=self._refresh_index, args=(folder, options),
+                                             daemon=True)
+        self.index_thread.start()
+    
+    def _refresh_index(self, folder, options):
+        """Muestra la vista previa del índice guardado y la repite tras actualizarlo"""
+        try:
+            index = self.index_store.load(folder)
+            if index is not None:
+                self.latest_preview = (folder, format_preview(index.preview(**options)))
+            else:
+                index = FolderIndex(folder)
+            index.refresh(self.hash_workers)
+            self.index_store.save(index)
+            self.latest_preview = (folder, format_preview(index.preview(**options)))
+        except Exception as e:
+            self.update_log(f"No se pudo actualizar el índice de la carpeta: {str(e)}", "warning")
+    
+    def update_preview(self):
+        """Muestra la vista previa de la carpeta y la actualiza cuando terminan las tareas"""
+        tasks = len(self.tasks.active_tasks())
+        if (self.index_tasks and not tasks) or (
+                self.index_pending and not self.index_thread.is_alive()):
+            # Las tareas pudieron cambiar la carpeta
+            self.index_pending = False
+            self.load_index()
+        self.index_tasks = tasks
+        preview = self.latest_preview
+        text = preview[1] if preview and preview[0] == self.selected_folder.get() else ""
+        if self.preview_label.cget('text') != text:
+            self.preview_label.configure(text=text)
+    
+    def cancel_tasks(self):
+        """Cancela las tareas en curso y las que esperan su turno"""
+        tasks = self.tasks.active_tasks()
+        if not tasks:
+            self.update_log("No hay tareas en ejecución", "warning")
+            return
+        self.tasks.cancel()
+        self.update_log(f"Cancelando {len(tasks)} tareas...", "warning")
+    
     def quit_app(self):
         """Cierra la aplicación guardando la configuración"""
         self.save_config()
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher = None
+        # Dejar que las tareas se detengan entre operaciones antes de salir
+        self.tasks.cancel()
+        for task in self.tasks.active_tasks():
+            task.wait(5)
+        self.scripts.cancel()
+        if self.python_pool:
+            self.python_pool.close()
         self.update_log("AutoTask finalizado. Configuración guardada.")
+        self.drain_log()
+        if self.activity_log:
+            self.activity_log.close()
+            self.activity_log = None
         self.root.quit()
     
     def validate_folder(self):
@@ -258,178 +656,143 @@ class TaskAutomationApp:
             return False
         return True
     
+    def start_task(self, name, **options):
+        """Ejecuta una tarea del motor en un hilo separado"""
+        folder = self.selected_folder.get()
+        options['dry_run'] = self.dry_run.get()
+        
+        # Se ejecuta en otro hilo; espera si otra tarea usa la misma carpeta
+        self.tasks.submit(TASKS[name][1], folder, lambda ctx: run_task(name, folder, ctx, **options),
+                          self.task_context())
+    
+    def task_context(self):
+        """Contexto de tarea que registra en el log y publica el progreso en la barra"""
+        base_dir = os.path.dirname(os.path.abspath(self.config_file))
+        return TaskContext(
+            log=self.update_log, progress=self.set_progress,
+            metrics_file=os.path.join(base_dir, METRICS_FILE) if self.task_metrics else None,
+            profile_dir=base_dir if self.task_profile else None,
+            journal=self.undo_journal
+        )
+    
     def rename_files(self):
         """Renombra archivos en la carpeta seleccionada"""
         if not self.validate_folder():
             return
-        
-        def rename_task():
-            self.task_in_progress = True
-            self.update_log("Iniciando renombrado de archivos...")
-            
-            try:
-                folder = self.selected_folder.get()
-                files = [f for f in os.listdir(folder) if os.path.isfile(os.path.join(folder, f))]
-                
-                if not files:
-                    self.update_log("No se encontraron archivos para renombrar", "warning")
-                    return
-                
-                for i, filename in enumerate(files, 1):
-                    name, ext = os.path.splitext(filename)
-                    new_name = f"documento_{i:03d}{ext}"
-                    old_path = os.path.join(folder, filename)
-                    new_path = os.path.join(folder, new_name)
-                    
-                    # Evitar sobreescribir archivos existentes
-                    counter = 1
-                    while os.path.exists(new_path):
-                        new_name = f"documento_{i:03d}_{counter}{ext}"
-                        new_path = os.path.join(folder, new_name)
-                        counter += 1
-                    
-                    os.rename(old_path, new_path)
-                    self.update_log(f"Renombrado: {filename} -> {new_name}")
-                
-                self.update_log("Renombrado completado exitosamente.", "success")
-            except Exception as e:
-                self.update_log(f"Error durante el renombrado: {str(e)}", "error")
-            finally:
-                self.task_in_progress = False
-        
-        # Ejecutar en un hilo separado para no bloquear la interfaz
-        threading.Thread(target=rename_task, daemon=True).start()
+        self.start_task('rename')
     
     def organize_by_type(self):
         """Organiza archivos por su extensión en subcarpetas"""
         if not self.validate_folder():
             return
-        
-        def organize_task():
-            self.task_in_progress = True
-            self.update_log("Organizando archivos por tipo...")
-            
-            try:
-                folder = self.selected_folder.get()
-                files = [f for f in os.listdir(folder) if os.path.isfile(os.path.join(folder, f))]
-                
-                if not files:
-                    self.update_log("No se encontraron archivos para organizar", "warning")
-                    return
-                
-                for filename in files:
-                    file_ext = os.path.splitext(filename)[1].lower()
-                    if not file_ext:
-                        file_ext = "sin_extension"
-                    else:
-                        file_ext = file_ext[1:]  # Quitar el punto
-                    
-                    # Crear carpeta si no existe
-                    type_folder = os.path.join(folder, file_ext)
-                    if not os.path.exists(type_folder):
-                        os.makedirs(type_folder)
-                        self.update_log(f"Creada carpeta: {file_ext}")
-                    
-                    # Mover archivo
-                    old_path = os.path.join(folder, filename)
-                    new_path = os.path.join(type_folder, filename)
-                    
-                    shutil.move(old_path, new_path)
-                    self.update_log(f"Movido: {filename} -> {file_ext}/")
-                
-                self.update_log("Organización completada exitosamente.", "success")
-            except Exception as e:
-                self.update_log(f"Error durante la organización: {str(e)}", "error")
-            finally:
-                self.task_in_progress = False
-        
-        threading.Thread(target=organize_task, daemon=True).start()
+        self.start_task('organize', workers=self.move_workers)
     
     def remove_duplicates(self):
-        """Elimina archivos duplicados basándose en su hash MD5"""
+        """Elimina archivos duplicados comparando su contenido"""
         if not self.validate_folder():
             return
-        
-        def remove_duplicates_task():
-            self.task_in_progress = True
-            self.update_log("Buscando y eliminando archivos duplicados...")
-            
-            try:
-                folder = self.selected_folder.get()
-                files = [f for f in os.listdir(folder) if os.path.isfile(os.path.join(folder, f))]
-                
-                if not files:
-                    self.update_log("No se encontraron archivos para analizar", "warning")
-                    return
-                
-                hashes = {}
-                duplicates_count = 0
-                
-                for filename in files:
-                    file_path = os.path.join(folder, filename)
-                    
-                    # Calcular hash MD5
-                    try:
-                        with open(file_path, 'rb') as f:
-                            file_hash = hashlib.md5(f.read()).hexdigest()
-                    except:
-                        self.update_log(f"No se pudo leer el archivo: {filename}", "warning")
-                        continue
-                    
-                    # Si el hash ya existe, es un duplicado
-                    if file_hash in hashes:
-                        os.remove(file_path)
-                        self.update_log(f"Eliminado duplicado: {filename}")
-                        duplicates_count += 1
-                    else:
-                        hashes[file_hash] = filename
-                
-                self.update_log(
-                    f"Eliminación de duplicados completada. Se eliminaron {duplicates_count} archivos.", 
-                    "success" if duplicates_count > 0 else "info"
-                )
-            except Exception as e:
-                self.update_log(f"Error durante la eliminación de duplicados: {str(e)}", "error")
-            finally:
-                self.task_in_progress = False
-        
-        threading.Thread(target=remove_duplicates_task, daemon=True).start()
+        self.start_task(
+            'dedupe',
+            recursive=self.dedupe_recursive.get(),
+            include=self.dedupe_include,
+            exclude=self.dedupe_exclude,
+            max_depth=self.dedupe_max_depth,
+            algorithm=self.hash_algorithm.get(),
+            workers=self.hash_workers,
+            cache_path=self.hash_cache_file if self.use_hash_cache else None,
+            verify=self.dedupe_verify.get(),
+            mode=self.selected_dedupe_mode()
+        )
+    
+    def undo_last_run(self):
+        """Deshace la última ejecución registrada en el diario de la carpeta"""
+        if not self.validate_folder():
+            return
+        if not self.dry_run.get() and not messagebox.askyesno(
+                "Deshacer", "¿Deshacer la última tarea ejecutada en esta carpeta?"):
+            return
+        self.start_task('undo')
+    
+    def selected_dedupe_mode(self):
+        """Modo de duplicados elegido en la lista ('delete', 'hardlink' o 'reflink')"""
+        for mode, label in DEDUPE_MODE_LABELS.items():
+            if label == self.dedupe_mode.get():
+                return mode
+        return 'delete'
     
     def clean_temporals(self):
         """Limpia archivos temporales en la carpeta seleccionada"""
         if not self.validate_folder():
             return
-        
-        def clean_temporals_task():
-            self.task_in_progress = True
-            self.update_log("Limpiando archivos temporales...")
-            
-            try:
-                folder = self.selected_folder.get()
-                temp_extensions = ['.tmp', '.temp', '.bak', '.backup', '.old']
-                deleted_count = 0
-                
-                for root, dirs, files in os.walk(folder):
-                    for filename in files:
-                        if any(filename.lower().endswith(ext) for ext in temp_extensions):
-                            file_path = os.path.join(root, filename)
-                            try:
-                                os.remove(file_path)
-                                self.update_log(f"Eliminado temporal: {filename}")
-                                deleted_count += 1
-                            except:
-                                self.update_log(f"No se pudo eliminar: {filename}", "warning")
-                
-                self.update_log(
-                    f"Limpieza completada. Se eliminaron {deleted_count} archivos temporales.", 
-                    "success" if deleted_count > 0 else "info"
-                )
-            except Exception as e:
-                self.update_log(f"Error durante la limpieza: {str(e)}", "error")
-            finally:
-                self.task_in_progress = False
-        
-        threading.Thread(target=clean_temporals_task, daemon=True).start()
+        self.start_task('clean', **self.clean_options())
+    
+    def clean_options(self):
+        """Opciones de la limpieza según la configuración"""
+        return {
+            'extensions': self.clean_extensions,
+            'patterns': self.clean_patterns,
+            'min_age_days': self.clean_min_age_days,
+            'min_size': self.clean_min_size,
+            'max_size': self.clean_max_size,
+            'prune': self.clean_prune,
+            'workers': self.clean_workers
+        }
+    
+    def run_pipeline(self):
+        """Ejecuta los pasos de saved_scripts sobre la carpeta seleccionada"""
+        if not self.validate_folder():
+            return
+        if not self.saved_scripts:
+            messagebox.showinfo("Pipeline", "No hay pasos definidos en saved_scripts (autotask_config.json).")
+            return
+        folder = self.selected_folder.get()
+        ctx = self.task_context()
+        try:
+            pipeline = Pipeline(
+                self.saved_scripts, folder, state=self.pipeline_state.setdefault(os.path.abspath(folder), {}),
+                max_parallel=self.pipeline_parallel, scripts=self.scripts,
+                script_timeout=self.script_timeout, dry_run=self.dry_run.get(),
+                task_defaults={
+                    'clean': self.clean_options(),
+                    'organize': {'workers': self.move_workers},
+                    'dedupe': {
+                        'recursive': self.dedupe_recursive.get(),
+                        'include': self.dedupe_include,
+                        'exclude': self.dedupe_exclude,
+                        'max_depth': self.dedupe_max_depth,
+                        'algorithm': self.hash_algorithm.get(),
+                        'workers': self.hash_workers,
+                        'cache_path': self.hash_cache_file if self.use_hash_cache else None,
+                        'verify': self.dedupe_verify.get(),
+                        'mode': self.selected_dedupe_mode()
+                    }
+                },
+                ctx=ctx
+            )
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        self.tasks.submit("el pipeline", folder, lambda ctx: pipeline.run(), ctx)
+    
+    def toggle_watch(self):
+        """Inicia o detiene la vigilancia de la carpeta seleccionada"""
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher = None
+            self.watch_button.configure(text="Vigilar Carpeta")
+            return
+        if not self.validate_folder():
+            return
+        self.watcher = FolderWatcher(
+            self.selected_folder.get(), actions=self.watch_actions, interval=self.watch_interval,
+            algorithm=self.hash_algorithm.get(),
+            matcher=TempMatcher(self.clean_extensions, self.clean_patterns, self.clean_min_age_days,
+                                self.clean_min_size, self.clean_max_size),
+            prune=self.clean_prune, tasks=self.tasks,
+            ctx=TaskContext(log=self.update_log, journal=self.undo_journal)
+        )
+        self.watcher.start()
+        self.watch_button.configure(text="Detener Vigilancia")
     
     def run_python_script(self):
         """Ejecuta un script Python seleccionado por el usuario"""
@@ -442,46 +805,7 @@ class TaskAutomationApp:
         if not script_path:
             return
         
-        def run_python_task():
-            self.task_in_progress = True
-            self.update_log(f"Ejecutando script Python: {os.path.basename(script_path)}")
-            
-            try:
-                # Ejecutar el script en un proceso separado
-                working_dir = self.selected_folder.get() if self.selected_folder.get() else os.path.dirname(script_path)
-                
-                result = subprocess.run(
-                    [sys.executable, script_path],
-                    cwd=working_dir,
-                    capture_output=True,
-                    text=True,
-                    timeout=300  # 5 minutos de timeout
-                )
-                
-                if result.stdout:
-                    self.update_log("Salida del script:", "info")
-                    for line in result.stdout.splitlines():
-                        self.update_log(f"  {line}", "info")
-                
-                if result.stderr:
-                    self.update_log("Errores del script:", "error")
-                    for line in result.stderr.splitlines():
-                        self.update_log(f"  {line}", "error")
-                
-                exit_code = result.returncode
-                if exit_code == 0:
-                    self.update_log(f"Script ejecutado exitosamente. Código de salida: {exit_code}", "success")
-                else:
-                    self.update_log(f"Script finalizado con errores. Código de salida: {exit_code}", "error")
-                    
-            except subprocess.TimeoutExpired:
-                self.update_log("El script excedió el tiempo máximo de ejecución (5 minutos).", "error")
-            except Exception as e:
-                self.update_log(f"Error ejecutando el script: {str(e)}", "error")
-            finally:
-                self.task_in_progress = False
-        
-        threading.Thread(target=run_python_task, daemon=True).start()
+        self.submit_script([sys.executable, script_path], script_path, warm=True)
     
     def run_ahk_script(self):
         """Ejecuta un script de AutoHotkey seleccionado por el usuario"""
@@ -495,62 +819,38 @@ class TaskAutomationApp:
             return
         
         # Verificar si AutoHotkey está instalado
-        ahk_path = None
-        possible_paths = [
-            "C:\\Program Files\\AutoHotkey\\AutoHotkey.exe",
-            "C:\\Program Files (x86)\\AutoHotkey\\AutoHotkey.exe"
-        ]
-        
-        for path in possible_paths:
-            if os.path.exists(path):
-                ahk_path = path
-                break
-        
+        ahk_path = find_autohotkey()
         if not ahk_path:
             messagebox.showerror("Error", "AutoHotkey no está instalado o no se pudo encontrar.")
             self.update_log("Error: AutoHotkey no está instalado", "error")
             return
         
-        def run_ahk_task():
-            self.task_in_progress = True
-            self.update_log(f"Ejecutando script AHK: {os.path.basename(script_path)}")
-            
-            try:
-                # Ejecutar el script de AutoHotkey
-                working_dir = self.selected_folder.get() if self.selected_folder.get() else os.path.dirname(script_path)
-                
-                result = subprocess.run(
-                    [ahk_path, script_path],
-                    cwd=working_dir,
-                    capture_output=True,
-                    text=True,
-                    timeout=300  # 5 minutos de timeout
-                )
-                
-                if result.stdout:
-                    self.update_log("Salida del script:", "info")
-                    for line in result.stdout.splitlines():
-                        self.update_log(f"  {line}", "info")
-                
-                if result.stderr:
-                    self.update_log("Errores del script:", "error")
-                    for line in result.stderr.splitlines():
-                        self.update_log(f"  {line}", "error")
-                
-                exit_code = result.returncode
-                if exit_code == 0:
-                    self.update_log(f"Script ejecutado exitosamente. Código de salida: {exit_code}", "success")
-                else:
-                    self.update_log(f"Script finalizado con errores. Código de salida: {exit_code}", "error")
-                    
-            except subprocess.TimeoutExpired:
-                self.update_log("El script excedió el tiempo máximo de ejecución (5 minutos).", "error")
-            except Exception as e:
-                self.update_log(f"Error ejecutando el script: {str(e)}", "error")
-            finally:
-                self.task_in_progress = False
-        
-        threading.Thread(target=run_ahk_task, daemon=True).start()
+        self.submit_script([ahk_path, script_path], script_path)
+    
+    def submit_script(self, command, script_path, warm=False):
+        """Encola un script en el planificador (se ejecuta en la carpeta seleccionada)"""
+        working_dir = self.selected_folder.get() if self.selected_folder.get() else os.path.dirname(script_path)
+        self.scripts.submit(command, cwd=working_dir, name=os.path.basename(script_path),
+                            timeout=self.script_timeout, warm=warm)
+    
+    def stop_scripts(self):
+        """Cancela los scripts en ejecución y los pendientes"""
+        jobs = self.scripts.active_jobs()
+        if not jobs:
+            self.update_log("No hay scripts en ejecución", "warning")
+            return
+        self.scripts.cancel()
+        self.update_log(f"Cancelando {len(jobs)} scripts...", "warning")
+    
+    def show_script_history(self):
+        """Muestra en el registro los últimos scripts terminados y su resultado"""
+        jobs = self.scripts.recent_history()
+        if not jobs:
+            self.update_log("Todavía no ha terminado ningún script", "warning")
+            return
+        self.update_log(f"Últimos {len(jobs)} scripts:")
+        for job in jobs:
+            self.update_log(f"  {job.summary()}", "success" if job.status == ScriptJob.SUCCEEDED else "error")
 
 def main():
     """Función principal"""
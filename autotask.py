@@ -0,0 +1,390 @@
+"""Punto de entrada de AutoTask: interfaz gráfica o modo de línea de comandos.
+
+Sin argumentos abre la interfaz gráfica. Con un subcomando ejecuta la tarea
+sin Tk (no se importa tkinter), por ejemplo desde cron:
+
+    python autotask.py dedupe /srv/compartido --recursive --json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from datetime import datetime
+
+from autotask_engine import (run_task, TaskContext, TaskManager, TempMatcher, TASKS, HASH_ALGORITHMS,
+                             DEFAULT_WORKERS, HASH_CACHE_FILE, TEMP_EXTENSIONS, CLEAN_PRUNE_DIRS, DEDUPE_MODES,
+                             format_progress)
+from autotask_watch import FolderWatcher, WATCH_ACTIONS
+from autotask_scripts import ScriptScheduler, ScriptJob, PythonWorkerPool, script_command
+from autotask_pipeline import Pipeline, COMPLETED, SKIPPED, task_defaults_from_config, folder_state
+from autotask_index import IndexStore, INDEX_DIR, format_preview
+
+GUI_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "automatizacion tareas.py")
+CONFIG_FILE = "autotask_config.json"
+
+
+def build_parser():
+    """Construye el analizador de argumentos de la línea de comandos"""
+    parser = argparse.ArgumentParser(
+        prog="autotask",
+        description="Automatización de tareas de archivos. Sin subcomando abre la interfaz gráfica."
+    )
+    # Opciones comunes a todos los subcomandos
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--json', action='store_true',
+                        help="emitir cada mensaje como una línea JSON")
+    planned = argparse.ArgumentParser(add_help=False)
+    planned.add_argument('--dry-run', action='store_true',
+                         help="mostrar las operaciones planificadas sin modificar ningún archivo")
+    planned.add_argument('--progress', action='store_true',
+                         help="mostrar el progreso en la salida de errores")
+    planned.add_argument('--metrics', metavar='ARCHIVO',
+                         help="añadir las métricas de cada tarea como una línea JSON al archivo")
+    planned.add_argument('--profile', metavar='CARPETA',
+                         help="guardar en CARPETA un informe de cProfile y tracemalloc por tarea")
+    planned.add_argument('--no-journal', action='store_true',
+                         help="no registrar las operaciones para deshacerlas (los borrados son definitivos)")
+    # Reglas de temporales y carpetas podadas: las comparten la limpieza y la vigilancia
+    temporals = argparse.ArgumentParser(add_help=False)
+    temporals.add_argument('--pattern', action='append', metavar='PATRON',
+                           help="patrón glob adicional de archivos temporales (p. ej. '~$*')")
+    temporals.add_argument('--extensions', default=",".join(TEMP_EXTENSIONS),
+                           help="extensiones temporales separadas por comas (por defecto %(default)s)")
+    temporals.add_argument('--min-age', type=float, metavar='DIAS',
+                           help="borrar solo archivos sin modificar desde hace al menos DIAS días")
+    temporals.add_argument('--min-size', type=int, metavar='BYTES', help="tamaño mínimo")
+    temporals.add_argument('--max-size', type=int, metavar='BYTES', help="tamaño máximo")
+    temporals.add_argument('--prune', action='append', metavar='PATRON',
+                           help="carpeta que no se recorre (por defecto " + ", ".join(CLEAN_PRUNE_DIRS) + ")")
+    temporals.add_argument('--no-prune', action='store_true', help="recorrer todas las carpetas")
+    subparsers = parser.add_subparsers(dest='command')
+
+    rename = subparsers.add_parser('rename', parents=[common, planned],
+                                   help="renombrar archivos con numeración consistente")
+    rename.add_argument('folder')
+
+    organize = subparsers.add_parser('organize', parents=[common, planned],
+                                     help="organizar archivos en subcarpetas por extensión")
+    organize.add_argument('folder')
+    organize.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                          help="hilos para las copias entre dispositivos")
+
+    dedupe = subparsers.add_parser('dedupe', parents=[common, planned],
+                                   help="eliminar archivos duplicados")
+    dedupe.add_argument('folder')
+    dedupe.add_argument('--recursive', action='store_true', help="incluir subcarpetas")
+    dedupe.add_argument('--include', action='append', metavar='PATRON',
+                        help="analizar solo archivos que coincidan con el patrón glob")
+    dedupe.add_argument('--exclude', action='append', metavar='PATRON',
+                        help="omitir archivos y carpetas que coincidan con el patrón glob")
+    dedupe.add_argument('--max-depth', type=int, help="profundidad máxima de subcarpetas")
+    dedupe.add_argument('--algorithm', choices=HASH_ALGORITHMS, default="md5")
+    dedupe.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help="hilos de cálculo de hash")
+    dedupe.add_argument('--cache', default=HASH_CACHE_FILE,
+                        help="ruta de la caché de hashes (por defecto %(default)s)")
+    dedupe.add_argument('--no-cache', action='store_true', help="no usar la caché de hashes")
+    dedupe.add_argument('--verify', action='store_true',
+                        help="confirmar byte a byte cada grupo de duplicados antes de borrar")
+    dedupe.add_argument('--mode', choices=DEDUPE_MODES, default='delete',
+                        help="borrar los duplicados o sustituirlos por enlaces duros o reflinks")
+
+    clean = subparsers.add_parser('clean', parents=[common, planned, temporals],
+                                  help="eliminar archivos temporales")
+    clean.add_argument('folder')
+    clean.add_argument('--workers', type=int, default=1,
+                       help="hilos para recorrer en paralelo las subcarpetas del primer nivel")
+
+    watch = subparsers.add_parser('watch', parents=[common, temporals],
+                                  help="vigilar la carpeta y procesar solo los archivos nuevos")
+    watch.add_argument('folder')
+    watch.add_argument('--actions', default=",".join(WATCH_ACTIONS),
+                       help="acciones separadas por comas (por defecto %(default)s)")
+    watch.add_argument('--interval', type=float, default=2.0,
+                       help="segundos entre comprobaciones en modo sondeo")
+    watch.add_argument('--settle', type=float, default=1.0,
+                       help="segundos que un archivo debe permanecer sin cambios antes de procesarlo")
+    watch.add_argument('--algorithm', choices=HASH_ALGORITHMS, default="md5")
+    watch.add_argument('--no-journal', action='store_true',
+                       help="no registrar las operaciones para deshacerlas (los borrados son definitivos)")
+
+    scripts = subparsers.add_parser('scripts', parents=[common],
+                                    help="ejecutar scripts (.py, .ahk u otros) en paralelo")
+    scripts.add_argument('scripts', nargs='+', metavar='script')
+    scripts.add_argument('--cwd', help="carpeta de trabajo de los scripts")
+    scripts.add_argument('--jobs', type=int, default=2, help="scripts simultáneos")
+    scripts.add_argument('--timeout', type=float, default=300,
+                         help="segundos máximos por script (0 = sin límite)")
+    scripts.add_argument('--warm', action='store_true',
+                         help="ejecutar los scripts .py en procesos Python precargados")
+    scripts.add_argument('--preload', action='append', default=[], metavar='MODULO',
+                         help="módulo a importar de antemano en los procesos precargados")
+
+    undo = subparsers.add_parser('undo', parents=[common, planned],
+                                 help="deshacer la última ejecución registrada en la carpeta")
+    undo.add_argument('folder')
+
+    preview = subparsers.add_parser('preview', parents=[common],
+                                    help="actualizar el índice de la carpeta y mostrar una vista previa")
+    preview.add_argument('folder')
+    preview.add_argument('--recursive', action='store_true', help="duplicados también en subcarpetas")
+    preview.add_argument('--index-dir', default=INDEX_DIR,
+                         help="carpeta de los índices guardados (por defecto %(default)s)")
+    preview.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                         help="hilos de cálculo de hash")
+
+    pipeline = subparsers.add_parser('pipeline', parents=[common, planned],
+                                     help="ejecutar el pipeline de saved_scripts sobre la carpeta")
+    pipeline.add_argument('folder')
+    pipeline.add_argument('--config', default=CONFIG_FILE,
+                          help="archivo de configuración con saved_scripts (por defecto %(default)s)")
+    pipeline.add_argument('--jobs', type=int, default=4, help="pasos simultáneos")
+    pipeline.add_argument('--force', action='store_true',
+                          help="ejecutar también los pasos cuya carpeta no cambió")
+
+    return parser
+
+
+def make_logger(as_json):
+    """Crea la función de registro que escribe en la salida estándar"""
+    # Las tareas y los scripts pueden registrar desde varios hilos a la vez
+    lock = threading.Lock()
+
+    def log(message, message_type="info"):
+        now = datetime.now()
+        if as_json:
+            line = json.dumps({'time': now.isoformat(timespec='seconds'), 'type': message_type,
+                               'message': message}, ensure_ascii=False)
+        else:
+            line = f"[{now.strftime('%H:%M:%S')}] {message}"
+        with lock:
+            sys.stdout.write(line + "\n")
+            sys.stdout.flush()
+    return log
+
+
+def make_progress(enabled):
+    """Crea la función que muestra el progreso en la salida de errores (o None)"""
+    if not enabled:
+        return None
+    last = [0.0]
+
+    def progress(state):
+        now = time.monotonic()
+        if now - last[0] >= 1.0 or (state.total and state.done >= state.total):
+            last[0] = now
+            sys.stderr.write(format_progress(state) + "\n")
+            sys.stderr.flush()
+    return progress
+
+
+def run_cancellable(label, folder, func, ctx):
+    """Ejecuta func(ctx) en un hilo; Ctrl+C cancela la tarea y espera a que se detenga"""
+    handle = TaskManager().submit(label, folder, func, ctx)
+    try:
+        # Esperar con sleep: interrumpir un join puede dejar el hilo en mal estado
+        while not handle.wait(0.2):
+            pass
+    except KeyboardInterrupt:
+        ctx.log("Cancelando... (la tarea se detiene entre operaciones)", "warning")
+        handle.cancel()
+        handle.wait()
+    return handle
+
+
+def task_context(args, log):
+    """Contexto de tarea con las opciones de progreso, métricas y perfilado"""
+    return TaskContext(log=log, progress=make_progress(args.progress),
+                       metrics_file=args.metrics and os.path.abspath(args.metrics),
+                       profile_dir=args.profile and os.path.abspath(args.profile),
+                       journal=not args.no_journal)
+
+
+def temporal_options(args):
+    """Reglas de temporales y carpetas podadas indicadas en los argumentos"""
+    return {
+        'extensions': [ext.strip() for ext in args.extensions.split(",") if ext.strip()],
+        'patterns': args.pattern,
+        'min_age_days': args.min_age,
+        'min_size': args.min_size,
+        'max_size': args.max_size,
+        'prune': [] if args.no_prune else (args.prune or list(CLEAN_PRUNE_DIRS)),
+    }
+
+
+def task_options(args):
+    """Traduce los argumentos del subcomando a las opciones de la tarea"""
+    if args.command == 'organize':
+        return {'dry_run': args.dry_run, 'workers': max(1, args.workers)}
+    if args.command == 'clean':
+        return {'dry_run': args.dry_run, **temporal_options(args), 'workers': max(1, args.workers)}
+    if args.command != 'dedupe':
+        return {'dry_run': args.dry_run}
+    return {
+        'dry_run': args.dry_run,
+        'recursive': args.recursive,
+        'include': args.include,
+        'exclude': args.exclude,
+        'max_depth': args.max_depth,
+        'algorithm': args.algorithm,
+        'workers': max(1, args.workers),
+        'cache_path': None if args.no_cache else os.path.abspath(args.cache),
+        'verify': args.verify,
+        'mode': args.mode,
+    }
+
+
+def watch_folder(args, log):
+    """Vigila la carpeta hasta que se interrumpe con Ctrl+C"""
+    actions = [action.strip() for action in args.actions.split(",") if action.strip()]
+    unknown = [action for action in actions if action not in WATCH_ACTIONS]
+    if unknown:
+        log(f"Acciones desconocidas: {', '.join(unknown)}", "error")
+        return 2
+    options = temporal_options(args)
+    prune = options.pop('prune')
+    watcher = FolderWatcher(args.folder, actions=actions, interval=args.interval,
+                            settle=args.settle, algorithm=args.algorithm, matcher=TempMatcher(**options),
+                            prune=prune, ctx=TaskContext(log=log, journal=not args.no_journal))
+    watcher.start()
+    try:
+        # Esperar con sleep: interrumpir un join puede dejar el hilo en mal estado
+        while watcher.thread.is_alive():
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
+    return 0
+
+
+def run_scripts(args, log):
+    """Ejecuta los scripts indicados con el límite de concurrencia y espera a todos"""
+    pool = PythonWorkerPool(size=args.jobs, preload=args.preload) if args.warm else None
+    scheduler = ScriptScheduler(max_concurrent=args.jobs, python_pool=pool, ctx=TaskContext(log=log))
+    jobs = []
+    for script in args.scripts:
+        try:
+            command = script_command(os.path.abspath(script))
+        except FileNotFoundError as e:
+            log(f"Error ejecutando el script {script}: {str(e)}", "error")
+            return 2
+        jobs.append(scheduler.submit(command, cwd=args.cwd, name=os.path.basename(script),
+                                     timeout=args.timeout or None, warm=args.warm))
+    try:
+        for job in jobs:
+            while not job.wait(0.5):
+                pass
+    except KeyboardInterrupt:
+        scheduler.cancel()
+        for job in jobs:
+            job.wait()
+    finally:
+        if pool:
+            pool.close()
+
+    if len(jobs) > 1:
+        log("Historial de scripts:")
+        for job in scheduler.recent_history(limit=len(jobs)):
+            log(f"  {job.summary()}", "success" if job.status == ScriptJob.SUCCEEDED else "error")
+    if args.json:
+        print(json.dumps([{'script': job.name, 'status': job.status, 'returncode': job.returncode,
+                           'duration': round(job.duration, 3)} for job in jobs],
+                         ensure_ascii=False), flush=True)
+    return 0 if all(job.status == ScriptJob.SUCCEEDED for job in jobs) else 1
+
+
+def run_pipeline(args, log):
+    """Ejecuta el pipeline guardado en la configuración y actualiza su estado"""
+    try:
+        with open(args.config, 'r') as f:
+            config = json.load(f)
+    except (OSError, ValueError) as e:
+        log(f"No se pudo leer la configuración {args.config}: {str(e)}", "error")
+        return 2
+    if not config.get('saved_scripts'):
+        log("La configuración no define pasos en saved_scripts", "warning")
+        return 0
+
+    ctx = task_context(args, log)
+    try:
+        pipeline = Pipeline(
+            config['saved_scripts'], args.folder, state=folder_state(config, args.folder),
+            max_parallel=args.jobs, script_timeout=config.get('script_timeout', 300) or None,
+            task_defaults=task_defaults_from_config(config, os.path.dirname(os.path.abspath(args.config))),
+            dry_run=args.dry_run, force=args.force, ctx=ctx
+        )
+    except ValueError as e:
+        log(str(e), "error")
+        return 2
+    results = {}
+    run_cancellable("el pipeline", args.folder, lambda ctx: results.update(pipeline.run()), ctx)
+    if not args.dry_run:
+        with open(args.config, 'w') as f:
+            json.dump(config, f, indent=4)
+
+    if args.json:
+        print(json.dumps({'pipeline': args.folder, 'steps': results}, ensure_ascii=False), flush=True)
+    return 0 if all(status in (COMPLETED, SKIPPED) for status in results.values()) else 1
+
+
+def preview_folder(args, log):
+    """Actualiza el índice guardado de la carpeta y muestra lo que harían las tareas"""
+    start = time.perf_counter()
+    store = IndexStore(os.path.abspath(args.index_dir))
+    index = store.load(args.folder)
+    if index is None:
+        index = store.refresh(args.folder, max(1, args.workers))
+        refreshed = "índice creado"
+    else:
+        rescanned = index.refresh(max(1, args.workers))
+        store.save(index)
+        refreshed = f"{rescanned} carpetas releídas"
+    preview = index.preview(recursive=args.recursive)
+    log(f"{format_preview(preview)} ({refreshed} en {time.perf_counter() - start:.2f} s)")
+    if args.json:
+        print(json.dumps({'preview': args.folder, **preview._asdict()}, ensure_ascii=False), flush=True)
+    return 0
+
+
+def main(argv=None):
+    """Función principal"""
+    args = build_parser().parse_args(argv)
+
+    if args.command is None:
+        # Interfaz gráfica (solo aquí se importa tkinter)
+        import runpy
+        runpy.run_path(GUI_SCRIPT, run_name="__main__")
+        return 0
+
+    log = make_logger(args.json)
+    if args.command == 'scripts':
+        return run_scripts(args, log)
+    if not os.path.isdir(args.folder):
+        log(f"La carpeta seleccionada no existe: {args.folder}", "error")
+        return 2
+
+    if args.command == 'watch':
+        return watch_folder(args, log)
+    if args.command == 'pipeline':
+        return run_pipeline(args, log)
+    if args.command == 'preview':
+        return preview_folder(args, log)
+
+    ctx = task_context(args, log)
+    outcome = {}
+    options = task_options(args)
+    run_cancellable(TASKS[args.command][1], args.folder,
+                    lambda ctx: outcome.update(result=run_task(args.command, args.folder, ctx, **options)),
+                    ctx)
+    result = outcome.get('result')
+    if args.json:
+        print(json.dumps({'task': args.command, 'folder': args.folder, 'ok': result is not None,
+                          'count': result}, ensure_ascii=False), flush=True)
+    return 0 if result is not None else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,353 @@
+"""Banco de pruebas de rendimiento de las tareas de AutoTask.
+
+Genera árboles de carpetas sintéticos y reproducibles (misma semilla, mismo
+árbol) en una carpeta temporal y mide cada tarea sin interfaz gráfica, en
+un proceso hijo por ejecución para que la memoria máxima y las llamadas al
+sistema de una tarea no se mezclen con las de otra:
+
+    python autotask_bench.py --files 20000 --duplicates 0.2 --json resultados.json
+    python autotask_bench.py --compare resultados.json
+
+El árbol se regenera antes de cada ejecución porque las tareas lo modifican.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from autotask_engine import run_task, TaskContext, TEMP_EXTENSIONS
+
+# Distribuciones de tamaño: lista de (peso, tamaño mínimo, tamaño máximo) en bytes
+SIZE_DISTRIBUTIONS = {
+    'small': [(1, 0, 4 * 1024)],
+    'mixed': [(70, 0, 16 * 1024), (25, 16 * 1024, 1024 * 1024), (5, 1024 * 1024, 16 * 1024 * 1024)],
+    'large': [(50, 1024 * 1024, 16 * 1024 * 1024), (50, 16 * 1024 * 1024, 64 * 1024 * 1024)],
+}
+EXTENSIONS = ('.txt', '.pdf', '.jpg', '.png', '.docx', '.xlsx', '.csv', '.zip', '.mp3', '')
+# Bloque pseudoaleatorio del que se toma el contenido de los archivos
+POOL_SIZE = 4 * 1024 * 1024
+# Opciones de cada tarea durante las mediciones
+BENCH_OPTIONS = {
+    'rename': {},
+    'organize': {},
+    'dedupe': {'recursive': True, 'cache_path': None},
+    'clean': {},
+}
+# Variación máxima (fracción) antes de marcar una regresión al comparar; las
+# diferencias menores que REGRESSION_MIN_SECONDS se consideran ruido
+REGRESSION_THRESHOLD = 0.10
+REGRESSION_MIN_SECONDS = 0.05
+
+
+def generate_tree(root, files=1000, depth=2, branching=3, sizes='mixed', duplicates=0.1,
+                  temps=0.05, top_level=0.3, seed=0):
+    """Crea un árbol sintético reproducible y devuelve sus estadísticas.
+
+    top_level es la fracción de archivos en el primer nivel (los únicos que
+    usan rename y organize); el resto se reparte entre las subcarpetas hasta
+    depth niveles con branching subcarpetas cada una. duplicates y temps son
+    las fracciones de archivos que son copias de otro o temporales.
+    """
+    rng = random.Random(seed)
+    pool = memoryview(rng.getrandbits(POOL_SIZE * 8).to_bytes(POOL_SIZE, 'little'))
+    distribution = SIZE_DISTRIBUTIONS[sizes]
+    weights = [weight for weight, low, high in distribution]
+
+    directories = [root]
+    level = [root]
+    for d in range(depth):
+        level = [os.path.join(parent, f"carpeta_{d}_{i}") for parent in level for i in range(branching)]
+        directories.extend(level)
+    for directory in directories:
+        os.makedirs(directory, exist_ok=True)
+
+    stats = {'files': 0, 'bytes': 0, 'top_files': 0, 'top_bytes': 0, 'duplicates': 0,
+             'temps': 0, 'directories': len(directories)}
+    originals = []
+    for i in range(files):
+        if rng.random() < top_level or len(directories) == 1:
+            directory = root
+        else:
+            directory = rng.choice(directories[1:])
+        if rng.random() < temps:
+            name = f"temporal_{i}{rng.choice(TEMP_EXTENSIONS)}"
+            stats['temps'] += 1
+        else:
+            name = f"archivo_{i}{rng.choice(EXTENSIONS)}"
+
+        if originals and rng.random() < duplicates:
+            size, header, offset = rng.choice(originals)
+            stats['duplicates'] += 1
+        else:
+            low, high = distribution[rng.choices(range(len(distribution)), weights)[0]][1:]
+            size = rng.randint(low, high)
+            header = i.to_bytes(8, 'little')
+            offset = rng.randrange(POOL_SIZE)
+            originals.append((size, header, offset))
+
+        with open(os.path.join(directory, name), 'wb') as f:
+            # Cabecera única por original + contenido tomado del bloque compartido
+            f.write(header[:size])
+            remaining = size - len(header)
+            position = offset
+            while remaining > 0:
+                piece = pool[position:position + remaining]
+                f.write(piece)
+                remaining -= len(piece)
+                position = 0
+        stats['files'] += 1
+        stats['bytes'] += size
+        if directory == root:
+            stats['top_files'] += 1
+            stats['top_bytes'] += size
+    return stats
+
+
+class SyscallCounter:
+    """Cuenta las operaciones de archivos de Python mediante eventos de auditoría.
+
+    sys.audit no emite eventos para stat, así que en Linux se añaden además
+    las llamadas de lectura y escritura de /proc/self/io. Los eventos de
+    auditoría existen desde Python 3.8; en versiones anteriores solo se
+    cuentan los de /proc/self/io.
+    """
+
+    EVENTS = ('open', 'os.scandir', 'os.listdir', 'os.rename', 'os.remove', 'os.mkdir',
+              'os.link', 'os.symlink', 'shutil.copyfile', 'shutil.move')
+
+    def __init__(self):
+        self.counts = dict.fromkeys(self.EVENTS, 0)
+        self.enabled = False
+        if hasattr(sys, 'addaudithook'):
+            sys.addaudithook(self._hook)
+
+    def _hook(self, event, args):
+        if self.enabled and event in self.counts:
+            self.counts[event] += 1
+
+    @staticmethod
+    def proc_io():
+        try:
+            with open('/proc/self/io') as f:
+                return {key: int(value) for key, value in (line.split(':') for line in f)}
+        except (OSError, ValueError):
+            return {}
+
+
+def peak_rss():
+    """Memoria residente máxima del proceso en bytes (None si no se puede medir)"""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa en KiB y macOS en bytes
+    return usage if sys.platform == 'darwin' else usage * 1024
+
+
+def measure(task, folder):
+    """Ejecuta una tarea en este proceso y devuelve sus métricas"""
+    counter = SyscallCounter()
+    messages = []
+    ctx = TaskContext(log=lambda message, message_type="info": messages.append(message_type))
+    io_before = counter.proc_io()
+    counter.enabled = True
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    result = run_task(task, folder, ctx, **BENCH_OPTIONS[task])
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    counter.enabled = False
+    io_after = counter.proc_io()
+
+    syscalls = {event.replace('os.', '').replace('shutil.', ''): count
+                for event, count in counter.counts.items() if count}
+    for key in ('syscr', 'syscw'):
+        if key in io_after:
+            syscalls[key] = io_after[key] - io_before.get(key, 0)
+    return {
+        'ok': result is not None and 'error' not in messages,
+        'operations': result,
+        'seconds': elapsed,
+        'cpu_seconds': cpu,
+        'syscalls': syscalls,
+        'bytes_read': io_after.get('rchar', 0) - io_before.get('rchar', 0) if io_after else None,
+        'peak_rss': peak_rss(),
+        'log_messages': len(messages),
+        'engine': ctx.metrics.to_dict(),
+    }
+
+
+def run_in_child(task, folder):
+    """Mide una tarea en un proceso nuevo (memoria y contadores aislados).
+
+    Si el proceso falla se devuelve una ejecución fallida con el final de su
+    salida de errores en lugar de interrumpir el banco de pruebas.
+    """
+    try:
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--measure', task, folder],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                universal_newlines=True, check=True).stdout
+        return json.loads(output.splitlines()[-1])
+    except (subprocess.CalledProcessError, ValueError, IndexError) as e:
+        stderr = getattr(e, 'stderr', None) or ''
+        lines = stderr.strip().splitlines()
+        return {'ok': False, 'error': lines[-1] if lines else str(e), 'seconds': None,
+                'syscalls': {}, 'peak_rss': None}
+
+
+def benchmark(tasks, repeat=3, keep=False, **tree_options):
+    """Genera el árbol y mide cada tarea repeat veces; devuelve el informe completo"""
+    report = {
+        'version': 1,
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'tree': dict(tree_options),
+        'tasks': {},
+    }
+    base = tempfile.mkdtemp(prefix="autotask-bench-")
+    try:
+        for task in tasks:
+            runs = []
+            for i in range(repeat):
+                folder = os.path.join(base, f"{task}_{i}")
+                stats = generate_tree(folder, **tree_options)
+                runs.append(run_in_child(task, folder))
+                if not keep:
+                    shutil.rmtree(folder, ignore_errors=True)
+            # rename y organize solo trabajan con el primer nivel
+            scope = 'top_' if task in ('rename', 'organize') else ''
+            files, size = stats[scope + 'files'], stats[scope + 'bytes']
+            # Las ejecuciones cuyo proceso falló no tienen tiempos
+            measured = [run['seconds'] for run in runs if run['seconds'] is not None]
+            seconds = statistics.median(measured) if measured else None
+            report['tree']['stats'] = stats
+            report['tasks'][task] = {
+                'ok': all(run['ok'] for run in runs),
+                'files': files,
+                'bytes': size,
+                'seconds': seconds,
+                'seconds_min': min(measured) if measured else None,
+                'files_per_second': files / seconds if seconds else None,
+                'bytes_per_second': size / seconds if seconds else None,
+                'runs': runs,
+            }
+    finally:
+        if keep:
+            print(f"Árboles generados en {base}")
+        else:
+            shutil.rmtree(base, ignore_errors=True)
+    return report
+
+
+def print_report(report, baseline=None):
+    """Muestra el informe como tabla y, si se indica, la variación frente a otro informe"""
+    stats = report['tree'].get('stats', {})
+    print(f"Árbol: {stats.get('files', 0)} archivos, {stats.get('bytes', 0) / (1024 * 1024):.1f} MB, "
+          f"{stats.get('directories', 0)} carpetas, {stats.get('duplicates', 0)} duplicados, "
+          f"{stats.get('temps', 0)} temporales")
+    print(f"{'tarea':<10} {'s (mediana)':>12} {'archivos/s':>12} {'MB/s':>9} {'syscalls':>10} "
+          f"{'RSS MB':>8}" + ("  variación" if baseline else ""))
+    regressions = []
+    for task, result in report['tasks'].items():
+        if result['seconds'] is None:
+            errors = sorted({run['error'] for run in result['runs'] if run.get('error')})
+            print(f"{task:<10} {'FALLIDA':>12}  {'; '.join(errors)}")
+            continue
+        run = result['runs'][-1]
+        rss = max((r['peak_rss'] or 0) for r in result['runs']) / (1024 * 1024)
+        line = (f"{task:<10} {result['seconds']:>12.3f} {result['files_per_second'] or 0:>12.0f} "
+                f"{(result['bytes_per_second'] or 0) / (1024 * 1024):>9.1f} "
+                f"{sum(run['syscalls'].values()):>10} {rss:>8.1f}")
+        if any(run.get('error') for run in result['runs']):
+            line += "  (ejecuciones fallidas)"
+        elif not result['ok']:
+            line += "  (con errores)"
+        previous = (baseline or {}).get('tasks', {}).get(task)
+        if previous and previous['seconds']:
+            change = result['seconds'] / previous['seconds'] - 1
+            line += f"  {change:+.1%}"
+            if (change > REGRESSION_THRESHOLD
+                    and result['seconds'] - previous['seconds'] > REGRESSION_MIN_SECONDS):
+                line += " REGRESIÓN"
+                regressions.append(task)
+        print(line)
+    return regressions
+
+
+def build_parser():
+    """Construye el analizador de argumentos del banco de pruebas"""
+    parser = argparse.ArgumentParser(prog="autotask_bench",
+                                     description="Mide el rendimiento de las tareas de AutoTask.")
+    parser.add_argument('--tasks', default=",".join(BENCH_OPTIONS),
+                        help="tareas separadas por comas (por defecto %(default)s)")
+    parser.add_argument('--files', type=int, default=5000, help="archivos del árbol")
+    parser.add_argument('--depth', type=int, default=2, help="niveles de subcarpetas")
+    parser.add_argument('--branching', type=int, default=3, help="subcarpetas por carpeta")
+    parser.add_argument('--sizes', choices=sorted(SIZE_DISTRIBUTIONS), default='small',
+                        help="distribución de tamaños de archivo")
+    parser.add_argument('--duplicates', type=float, default=0.1, help="fracción de duplicados")
+    parser.add_argument('--temps', type=float, default=0.05, help="fracción de temporales")
+    parser.add_argument('--top-level', type=float, default=0.3,
+                        help="fracción de archivos en el primer nivel")
+    parser.add_argument('--seed', type=int, default=0, help="semilla del generador")
+    parser.add_argument('--repeat', type=int, default=3, help="ejecuciones por tarea (se usa la mediana)")
+    parser.add_argument('--json', metavar='ARCHIVO', help="guardar el informe en JSON")
+    parser.add_argument('--compare', metavar='ARCHIVO',
+                        help="comparar con un informe anterior (código de salida 1 si hay regresiones)")
+    parser.add_argument('--keep', action='store_true', help="no borrar los árboles generados")
+    parser.add_argument('--generate', metavar='CARPETA',
+                        help="solo generar el árbol en CARPETA, sin medir")
+    parser.add_argument('--measure', nargs=2, metavar=('TAREA', 'CARPETA'), help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    """Función principal"""
+    args = build_parser().parse_args(argv)
+    if args.measure:
+        # Proceso hijo: una sola medición, resultado en la última línea
+        print(json.dumps(measure(*args.measure)))
+        return 0
+
+    tree_options = {'files': args.files, 'depth': args.depth, 'branching': args.branching,
+                    'sizes': args.sizes, 'duplicates': args.duplicates, 'temps': args.temps,
+                    'top_level': args.top_level, 'seed': args.seed}
+    if args.generate:
+        stats = generate_tree(args.generate, **tree_options)
+        print(json.dumps(stats))
+        return 0
+
+    tasks = [task.strip() for task in args.tasks.split(",") if task.strip()]
+    unknown = [task for task in tasks if task not in BENCH_OPTIONS]
+    if unknown:
+        print(f"Tareas desconocidas: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    report = benchmark(tasks, repeat=max(1, args.repeat), keep=args.keep, **tree_options)
+    regressions = print_report(report, baseline)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=4)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2010 @@
+"""Motor de tareas de archivos de AutoTask (independiente de la interfaz)"""
+import io
+import os
+import re
+import sys
+import json
+import time
+import errno
+import uuid
+import shutil
+import fnmatch
+import hashlib
+import sqlite3
+import threading
+from json.encoder import encode_basestring_ascii
+from contextlib import contextmanager
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Tamaño de bloque para la lectura por partes (memoria constante)
+CHUNK_SIZE = 1024 * 1024
+# Bytes leídos al inicio y al final de un archivo para el hash parcial
+PARTIAL_SIZE = 64 * 1024
+# Hilos de hash por defecto: el trabajo es de E/S y hashlib libera el GIL
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+
+# Algoritmos disponibles; los xxh* son no criptográficos y requieren xxhash
+HASH_ALGORITHMS = ['md5', 'sha1', 'sha256', 'blake2b']
+if xxhash is not None:
+    HASH_ALGORITHMS += ['xxh64', 'xxh3_64', 'xxh3_128']
+
+# Extensiones de archivos temporales y de backup
+TEMP_EXTENSIONS = ('.tmp', '.temp', '.bak', '.backup', '.old')
+# Carpetas que la limpieza no recorre por defecto (repositorios, dependencias, cachés)
+CLEAN_PRUNE_DIRS = ('.git', '.svn', '.hg', 'node_modules', '__pycache__')
+
+# Qué hacer con cada duplicado: borrarlo o sustituirlo por un enlace al original
+DEDUPE_MODES = ('delete', 'hardlink', 'reflink')
+# ioctl de Linux para clonar un archivo compartiendo bloques (Btrfs, XFS, bcachefs...)
+FICLONE = 0x40049409
+
+# Archivo de la caché de hashes (junto a autotask_config.json)
+HASH_CACHE_FILE = "autotask_hashes.db"
+# Carpeta del diario de deshacer y de la cuarentena, dentro de cada carpeta de trabajo
+# (las tareas nunca la recorren)
+JOURNAL_DIR = ".autotask_deshacer"
+JOURNAL_FILE = "diario.jsonl"
+QUARANTINE_DIR = "cuarentena"
+# Ejecuciones que se conservan en el diario (y sus archivos en la cuarentena)
+JOURNAL_KEEP_RUNS = 3
+
+FileEntry = namedtuple('FileEntry', ['path', 'name', 'size', 'mtime_ns', 'inode'])
+
+
+def compile_patterns(patterns):
+    """Compila una lista de patrones glob en una única expresión regular (o None)"""
+    if not patterns:
+        return None
+    return re.compile('|'.join(fnmatch.translate(os.path.normcase(p)) for p in patterns))
+
+
+def scan_files(folder, recursive=False, include=None, exclude=None, max_depth=None, on_error=None,
+               metrics=None, names=None):
+    """Recorre una carpeta con os.scandir y genera un FileEntry por archivo.
+
+    Reutiliza el stat de cada DirEntry en lugar de llamar a os.path.isfile
+    por archivo. Los patrones glob de include/exclude se comparan con el
+    nombre y con la ruta relativa (separada por '/'); exclude también poda
+    subcarpetas completas. max_depth limita la profundidad (0 = solo el
+    primer nivel). Los enlaces simbólicos y la carpeta JOURNAL_DIR se
+    ignoran. Con metrics se cuentan las carpetas leídas y los stat. Con
+    names (un set) se añaden en la misma lectura los nombres normalizados de
+    todas las entradas, sean archivos o no.
+    """
+    include_re = compile_patterns(include)
+    exclude_re = compile_patterns(exclude)
+    if not recursive:
+        max_depth = 0
+
+    def matches(regex, entry, rel_path):
+        return regex.match(os.path.normcase(entry.name)) or regex.match(os.path.normcase(rel_path))
+
+    stack = [(folder, '', 0)]
+    while stack:
+        path, rel_dir, depth = stack.pop()
+        if metrics:
+            metrics.count('scandir')
+        try:
+            it = os.scandir(path)
+        except OSError as e:
+            if on_error:
+                on_error(path, e)
+            continue
+        subdirs = []
+        with it:
+            for entry in it:
+                if names is not None:
+                    names.add(os.path.normcase(entry.name))
+                rel_path = rel_dir + entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name == JOURNAL_DIR:
+                            continue
+                        if (max_depth is None or depth < max_depth) and not (
+                                exclude_re and matches(exclude_re, entry, rel_path)):
+                            subdirs.append((entry.path, rel_path + '/', depth + 1))
+                        continue
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    if exclude_re and matches(exclude_re, entry, rel_path):
+                        continue
+                    if include_re and not matches(include_re, entry, rel_path):
+                        continue
+                    if metrics:
+                        metrics.count('stat')
+                    st = entry.stat(follow_symlinks=False)
+                    inode = st.st_ino or entry.inode()
+                except OSError as e:
+                    if on_error:
+                        on_error(entry.path, e)
+                    continue
+                yield FileEntry(entry.path, entry.name, st.st_size, st.st_mtime_ns, inode)
+        # Procesar las subcarpetas en orden de aparición
+        stack.extend(reversed(subdirs))
+
+
+def list_files(folder, metrics=None, names=None):
+    """Lista los archivos del primer nivel de una carpeta (names como en scan_files)"""
+    return list(scan_files(folder, metrics=metrics, names=names))
+
+
+class TempMatcher:
+    """Reglas de archivos temporales compiladas una sola vez.
+
+    Un archivo es temporal si su nombre termina en una de las extensiones
+    (comparación sin mayúsculas, con una tupla de sufijos) o coincide con
+    alguno de los patrones glob, unidos en una sola expresión regular.
+    min_age_days, min_size y max_size solo se comprueban, con un stat, en
+    los archivos cuyo nombre ya coincide.
+    """
+
+    def __init__(self, extensions=TEMP_EXTENSIONS, patterns=None, min_age_days=None,
+                 min_size=None, max_size=None):
+        self.suffixes = tuple(ext.lower() for ext in extensions or ())
+        self.pattern_re = compile_patterns(patterns)
+        self.min_age = min_age_days * 86400 if min_age_days else None
+        self.min_size = min_size
+        self.max_size = max_size
+
+    def match_name(self, filename):
+        """Comprueba solo el nombre del archivo"""
+        if self.suffixes and filename.lower().endswith(self.suffixes):
+            return True
+        return self.pattern_re is not None and self.pattern_re.match(os.path.normcase(filename)) is not None
+
+    def match_stat(self, st, now=None):
+        """Comprueba los umbrales de antigüedad y tamaño"""
+        if self.min_size is not None and st.st_size < self.min_size:
+            return False
+        if self.max_size is not None and st.st_size > self.max_size:
+            return False
+        if self.min_age is not None and (now or time.time()) - st.st_mtime < self.min_age:
+            return False
+        return True
+
+
+DEFAULT_TEMP_MATCHER = TempMatcher()
+
+
+def is_temporal(filename):
+    """Indica si un nombre de archivo corresponde a un temporal o backup"""
+    return DEFAULT_TEMP_MATCHER.match_name(filename)
+
+
+def new_hasher(algorithm):
+    """Crea un objeto de hash para el algoritmo indicado"""
+    if algorithm.startswith('xxh'):
+        if xxhash is None:
+            raise ValueError(f"El algoritmo {algorithm} requiere el paquete xxhash")
+        return getattr(xxhash, algorithm)()
+    return hashlib.new(algorithm)
+
+
+def hash_file(path, algorithm="md5", chunk_size=CHUNK_SIZE):
+    """Calcula el hash completo de un archivo leyéndolo por bloques"""
+    hasher = new_hasher(algorithm)
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            read = f.readinto(buffer)
+            if not read:
+                break
+            hasher.update(view[:read])
+    return hasher.hexdigest()
+
+
+def _read_full(f, buffer):
+    """Llena el búfer leyendo del archivo (repite lecturas cortas); devuelve los bytes leídos"""
+    view = memoryview(buffer)
+    total = 0
+    while total < len(view):
+        read = f.readinto(view[total:])
+        if not read:
+            break
+        total += read
+    return total
+
+
+# Archivos abiertos a la vez como máximo al comparar un grupo
+COMPARE_MAX_OPEN = 64
+
+
+def _partition(entries, chunk_size, stats):
+    """Reparte hasta COMPARE_MAX_OPEN archivos del mismo tamaño en clases de contenido idéntico.
+
+    Devuelve todas las clases, también las de un solo archivo.
+    """
+    if len(entries) < 2:
+        return [list(entries)]
+    files = []
+    try:
+        for entry in entries:
+            files.append((entry, open(entry.path, 'rb', buffering=0), bytearray(chunk_size)))
+        if stats is not None:
+            stats['open'] = stats.get('open', 0) + len(files)
+        # Clases de archivos cuyo contenido coincide hasta el bloque actual
+        classes = [files]
+        finished = []
+        while classes:
+            next_classes = []
+            for members in classes:
+                split = []
+                for member in members:
+                    read = _read_full(member[1], member[2])
+                    if stats is not None:
+                        stats['bytes_leidos'] = stats.get('bytes_leidos', 0) + read
+                    # Tras los read bytes quedan los del bloque anterior, que ya
+                    # coincidían dentro de la clase: basta comparar el búfer entero
+                    for candidate_read, candidates in split:
+                        if candidate_read == read and candidates[0][2] == member[2]:
+                            candidates.append(member)
+                            break
+                    else:
+                        split.append((read, [member]))
+                for read, candidates in split:
+                    if read and len(candidates) > 1:
+                        next_classes.append(candidates)
+                    else:
+                        finished.append([member[0] for member in candidates])
+            classes = next_classes
+        return finished
+    finally:
+        for member in files:
+            member[1].close()
+
+
+def _merge_classes(classes, chunk_size, stats):
+    """Une las clases con el mismo contenido comparando un representante de cada una.
+
+    En cada vuelta la primera clase pendiente se compara por lotes con los
+    representantes de las demás; las iguales se le unen y las que coinciden
+    entre sí dentro de un lote también se unen. Sin recursión: si todas las
+    clases son iguales basta una vuelta.
+    """
+    merged = []
+    pending = classes
+    while pending:
+        head, rest = pending[0], pending[1:]
+        remaining = []
+        for i in range(0, len(rest), COMPARE_MAX_OPEN - 1):
+            batch = [head] + rest[i:i + COMPARE_MAX_OPEN - 1]
+            by_first = {id(members[0]): members for members in batch}
+            for same in _partition([members[0] for members in batch], chunk_size, stats):
+                joined = [entry for first in same for entry in by_first[id(first)]]
+                if same[0] is head[0]:
+                    head = joined
+                else:
+                    remaining.append(joined)
+        merged.append(head)
+        pending = remaining
+    return merged
+
+
+def compare_group(entries, chunk_size=CHUNK_SIZE, stats=None):
+    """Confirma byte a byte que los archivos de un grupo son idénticos.
+
+    Todos los archivos del grupo (del mismo tamaño) se leen a la vez por
+    bloques en búferes reutilizados y se reparten en clases según el
+    contenido de cada bloque; un archivo que queda solo en su clase deja de
+    leerse, de modo que una diferencia se detecta en el primer bloque
+    distinto. Los grupos de más de COMPARE_MAX_OPEN archivos se reparten
+    por lotes y después se unen las clases de distintos lotes (incluidos
+    los archivos que quedaron solos en su lote) comparando un representante
+    de cada una. Devuelve la lista de subgrupos idénticos (de dos o más
+    archivos) conservando el orden. stats, si se indica, es un diccionario
+    donde se suman 'open' y 'bytes_leidos'.
+    """
+    classes = []
+    for i in range(0, len(entries), COMPARE_MAX_OPEN):
+        classes.extend(_partition(entries[i:i + COMPARE_MAX_OPEN], chunk_size, stats))
+    if len(classes) > 1 and len(entries) > COMPARE_MAX_OPEN:
+        classes = _merge_classes(classes, chunk_size, stats)
+    order = {id(entry): i for i, entry in enumerate(entries)}
+    groups = [sorted(members, key=lambda entry: order[id(entry)])
+              for members in classes if len(members) > 1]
+    groups.sort(key=lambda members: order[id(members[0])])
+    return groups
+
+
+def hash_file_partial(path, size, algorithm="md5", partial_size=PARTIAL_SIZE):
+    """Calcula un hash del inicio y el final de un archivo"""
+    hasher = new_hasher(algorithm)
+    with open(path, 'rb') as f:
+        hasher.update(f.read(partial_size))
+        if size > partial_size:
+            f.seek(max(partial_size, size - partial_size))
+            hasher.update(f.read(partial_size))
+    return hasher.hexdigest()
+
+
+class HashCache:
+    """Caché persistente de hashes en SQLite.
+
+    Cada registro se identifica por ruta, algoritmo y tipo de hash (parcial
+    o completo) y solo se considera válido si el tamaño, la fecha de
+    modificación (mtime_ns) y el inodo siguen coincidiendo. Las escrituras
+    se agrupan en lotes y al cerrar se eliminan los registros más antiguos
+    que max_age_days y los menos usados por encima de max_entries.
+    """
+
+    BATCH_SIZE = 1000
+
+    def __init__(self, path, max_entries=500000, max_age_days=90):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._pending = []
+        self._used = []
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS hashes ("
+            "path TEXT NOT NULL, algorithm TEXT NOT NULL, kind TEXT NOT NULL, "
+            "size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, inode INTEGER NOT NULL, "
+            "digest TEXT NOT NULL, last_used REAL NOT NULL, "
+            "PRIMARY KEY (path, algorithm, kind))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS hashes_last_used ON hashes (last_used)")
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def _key(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def get(self, entry, algorithm, kind):
+        """Devuelve el hash guardado si el archivo no ha cambiado, o None"""
+        key = self._key(entry.path)
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT size, mtime_ns, inode, digest FROM hashes "
+                "WHERE path = ? AND algorithm = ? AND kind = ?",
+                (key, algorithm, kind)
+            ).fetchone()
+            if row is None or tuple(row[:3]) != (entry.size, entry.mtime_ns, entry.inode):
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._used.append((time.time(), key, algorithm, kind))
+            if len(self._used) >= self.BATCH_SIZE:
+                self._flush()
+            return row[3]
+
+    def put(self, entry, algorithm, kind, digest):
+        """Guarda el hash de un archivo (se escribe en lotes)"""
+        with self.lock:
+            self._pending.append((self._key(entry.path), algorithm, kind, entry.size,
+                                  entry.mtime_ns, entry.inode, digest, time.time()))
+            if len(self._pending) >= self.BATCH_SIZE:
+                self._flush()
+
+    def _flush(self):
+        if self._pending:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self._pending)
+            self._pending = []
+        if self._used:
+            self.conn.executemany(
+                "UPDATE hashes SET last_used = ? WHERE path = ? AND algorithm = ? AND kind = ?",
+                self._used)
+            self._used = []
+        self.conn.commit()
+
+    def evict(self):
+        """Elimina registros antiguos y los menos usados si se supera el límite"""
+        with self.lock:
+            self._flush()
+            if self.max_age_days:
+                self.conn.execute("DELETE FROM hashes WHERE last_used < ?",
+                                  (time.time() - self.max_age_days * 86400,))
+            if self.max_entries:
+                count = self.conn.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+                if count > self.max_entries:
+                    self.conn.execute(
+                        "DELETE FROM hashes WHERE rowid IN "
+                        "(SELECT rowid FROM hashes ORDER BY last_used LIMIT ?)",
+                        (count - self.max_entries,))
+            self.conn.commit()
+
+    def close(self):
+        """Guarda los cambios pendientes, aplica la expulsión y cierra la base de datos"""
+        if self.conn is None:
+            return
+        self.evict()
+        with self.lock:
+            self.conn.close()
+            self.conn = None
+
+
+def map_bounded(func, items, workers=DEFAULT_WORKERS, max_in_flight=None):
+    """Aplica func a cada elemento en un pool de hilos con trabajo en curso acotado.
+
+    Devuelve tuplas (elemento, resultado, error) a medida que terminan, sin
+    encolar más de max_in_flight tareas a la vez para mantener la memoria
+    constante con carpetas muy grandes.
+    """
+    if workers <= 1:
+        for item in items:
+            try:
+                yield item, func(item), None
+            except Exception as e:
+                yield item, None, e
+        return
+
+    max_in_flight = max_in_flight or workers * 4
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        items = iter(items)
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < max_in_flight:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[executor.submit(func, item)] = item
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                error = future.exception()
+                yield item, (None if error else future.result()), error
+
+
+def _group_by(entries, key_func, on_error, workers, ctx=None, phase=None, bytes_func=None):
+    """Agrupa entradas por clave descartando las que fallan y los grupos de un solo elemento"""
+    ctx = ctx or TaskContext()
+    groups = {}
+    total_bytes = sum(bytes_func(entry) for entry in entries) if bytes_func else 0
+    done = 0
+    done_bytes = 0
+    for entry, key, error in map_bounded(key_func, entries, workers):
+        ctx.check_cancelled()
+        done += 1
+        if bytes_func:
+            done_bytes += bytes_func(entry)
+        ctx.progress(phase, done, len(entries), done_bytes, total_bytes)
+        if error is not None:
+            if not isinstance(error, OSError):
+                raise error
+            if on_error:
+                on_error(entry, error)
+            continue
+        groups.setdefault(key, []).append(entry)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def _verify_groups(groups, workers, ctx, on_error):
+    """Confirma byte a byte los grupos de duplicados y descarta las colisiones de hash"""
+    def compare(group):
+        stats = {}
+        return compare_group(group, stats=stats), stats
+
+    to_compare = [group for group in groups if group[0].size > 0]
+    confirmed = [group for group in groups if group[0].size == 0]
+    total_bytes = sum(group[0].size * len(group) for group in to_compare)
+    done_bytes = 0
+    for done, (group, result, error) in enumerate(map_bounded(compare, to_compare, workers), 1):
+        ctx.check_cancelled()
+        done_bytes += group[0].size * len(group)
+        ctx.progress("Verificando", done, len(to_compare), done_bytes, total_bytes)
+        if error is not None:
+            if not isinstance(error, OSError):
+                raise error
+            if on_error:
+                on_error(group[0], error)
+            continue
+        subgroups, stats = result
+        for name, amount in stats.items():
+            ctx.metrics.count(name, amount)
+        if sum(len(subgroup) for subgroup in subgroups) != len(group):
+            ctx.log(f"Contenido distinto con el mismo hash: {group[0].name} y otros "
+                    f"{len(group) - 1} archivos; solo se eliminan las copias confirmadas", "warning")
+        confirmed.extend(subgroups)
+    return confirmed
+
+
+def find_duplicates(entries, algorithm="md5", workers=DEFAULT_WORKERS, cache=None, on_error=None,
+                    ctx=None, verify=False, digests=None):
+    """Encuentra grupos de archivos con contenido idéntico.
+
+    La búsqueda se hace por etapas: primero se agrupan los archivos por
+    tamaño, después se calcula un hash parcial (inicio y final) solo dentro
+    de los grupos del mismo tamaño y, por último, el hash completo solo para
+    los candidatos que siguen coincidiendo. Los hashes de cada etapa se
+    calculan en paralelo con workers hilos y, si se indica una HashCache,
+    solo se recalculan los de archivos nuevos o modificados. Cada grupo
+    conserva el orden de entrada, de modo que el primer elemento es el
+    original. Con ctx se publica el progreso de cada etapa y se atiende la
+    cancelación. Con verify los grupos se confirman además byte a byte
+    (compare_group). Si se pasa un diccionario digests, se rellena con el
+    hash de cada archivo.
+    """
+    by_size = {}
+    for entry in entries:
+        by_size.setdefault(entry.size, []).append(entry)
+
+    duplicates = []
+    candidates = []
+    for size, group in by_size.items():
+        if len(group) < 2:
+            continue
+        if size == 0:
+            # Todos los archivos vacíos son idénticos
+            duplicates.append(group)
+        else:
+            candidates.extend(group)
+
+    partial_kind = f"partial:{PARTIAL_SIZE}"
+    metrics = (ctx or TaskContext()).metrics
+
+    def cached(entry, kind, compute, size):
+        digest = cache.get(entry, algorithm, kind) if cache is not None else None
+        if digest is None:
+            digest = compute()
+            metrics.count('open')
+            metrics.count('bytes_leidos', size)
+            if cache is not None:
+                cache.put(entry, algorithm, kind, digest)
+        if digests is not None:
+            # El hash completo sustituye al parcial cuando se calcula
+            digests[entry.path] = digest
+        return digest
+
+    def partial_key(entry):
+        return entry.size, cached(
+            entry, partial_kind, lambda: hash_file_partial(entry.path, entry.size, algorithm),
+            min(entry.size, 2 * PARTIAL_SIZE))
+
+    def full_key(entry):
+        return entry.size, cached(entry, "full", lambda: hash_file(entry.path, algorithm), entry.size)
+
+    def partial_bytes(entry):
+        return min(entry.size, 2 * PARTIAL_SIZE)
+
+    full_candidates = []
+    with metrics.phase('hash parcial'):
+        partial_groups = _group_by(candidates, partial_key, on_error, workers, ctx, "Hash parcial",
+                                   partial_bytes)
+    for group in partial_groups:
+        if group[0].size <= 2 * PARTIAL_SIZE:
+            # El hash parcial ya cubre todo el archivo
+            duplicates.append(group)
+        else:
+            full_candidates.extend(group)
+    with metrics.phase('hash completo'):
+        duplicates.extend(_group_by(full_candidates, full_key, on_error, workers, ctx,
+                                    "Hash completo", lambda entry: entry.size))
+    if verify:
+        with metrics.phase('verificar'):
+            duplicates = _verify_groups(duplicates, workers, ctx or TaskContext(), on_error)
+
+    # Mantener el orden original de los archivos
+    order = {entry.path: i for i, entry in enumerate(entries)}
+    for group in duplicates:
+        group.sort(key=lambda e: order[e.path])
+    duplicates.sort(key=lambda g: order[g[0].path])
+    return duplicates
+
+
+class TaskCancelled(Exception):
+    """La tarea se canceló a petición del usuario"""
+
+
+# Progreso de una fase: total y bytes_total son 0 si no se conocen de antemano;
+# eta son los segundos estimados que faltan (None si no se puede estimar)
+Progress = namedtuple('Progress', ['phase', 'done', 'total', 'bytes_done', 'bytes_total', 'eta'])
+
+
+class Metrics:
+    """Tiempos por fase y contadores (llamadas al sistema, bytes) de una ejecución"""
+
+    # Contadores que corresponden a llamadas al sistema
+    SYSCALLS = ('scandir', 'stat', 'open', 'rename', 'remove', 'mkdir', 'copy', 'link')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phases = {}
+        self.counters = {}
+        self.start = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        """Acumula el tiempo del bloque en la fase indicada"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    @property
+    def syscalls(self):
+        return sum(self.counters.get(name, 0) for name in self.SYSCALLS)
+
+    def summary(self):
+        """Línea de resumen para el registro"""
+        # El registro se mide dentro de las demás fases: se muestra al final
+        order = sorted(self.phases, key=lambda name: name == 'registro')
+        phases = ", ".join(f"{name} {self.phases[name]:.2f} s" for name in order)
+        text = f"{self.elapsed:.2f} s en total"
+        if phases:
+            text += f" ({phases})"
+        text += (f"; {self.counters.get('archivos', 0)} archivos, "
+                 f"{self.counters.get('bytes_leidos', 0) / (1024 * 1024):.1f} MB leídos, "
+                 f"{self.syscalls} llamadas al sistema")
+        return text
+
+    def to_dict(self):
+        """Métricas en un diccionario serializable en JSON"""
+        with self.lock:
+            return {'seconds': round(self.elapsed, 6),
+                    'phases': {name: round(seconds, 6) for name, seconds in self.phases.items()},
+                    'counters': dict(self.counters), 'syscalls': self.syscalls}
+
+
+class TaskContext:
+    """Contexto de ejecución de una tarea: registro, cancelación, progreso y métricas.
+
+    Las tareas llaman a check_cancelled() en sus bucles internos, que lanza
+    TaskCancelled si se pidió cancelar, y a progress() para publicar su
+    avance. El callback de progreso se llama como mucho cada
+    PROGRESS_INTERVAL segundos (y siempre al completar una fase). run_task
+    crea un Metrics nuevo en cada ejecución; con metrics_file se añade una
+    línea JSON por tarea a ese archivo y con profile_dir se guarda en esa
+    carpeta un informe de cProfile y tracemalloc. Con journal, apply_plan
+    registra cada operación en el diario de deshacer de la carpeta.
+    """
+
+    PROGRESS_INTERVAL = 0.1
+
+    def __init__(self, log=None, progress=None, cancel_event=None, metrics_file=None,
+                 profile_dir=None, journal=False):
+        self._log = log
+        self._progress = progress
+        self.cancel_event = cancel_event or threading.Event()
+        self.metrics_file = metrics_file
+        self.profile_dir = profile_dir
+        self.journal = journal
+        self.metrics = Metrics()
+        self._phase = None
+        self._phase_start = 0.0
+        self._last_progress = 0.0
+
+    def child(self, cancel_event=None):
+        """Contexto con el mismo registro, progreso y cancelación pero métricas propias.
+
+        Con cancel_event la cancelación del nuevo contexto es independiente.
+        """
+        return TaskContext(self._log, self._progress, cancel_event or self.cancel_event,
+                           self.metrics_file, self.profile_dir, self.journal)
+
+    def log(self, message, message_type="info"):
+        """Envía un mensaje al registro (info, success, warning o error)"""
+        if self._log:
+            start = time.perf_counter()
+            self._log(message, message_type)
+            self.metrics.add_time('registro', time.perf_counter() - start)
+
+    def cancel(self):
+        """Solicita cancelar la tarea (seguro desde cualquier hilo)"""
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def check_cancelled(self):
+        """Lanza TaskCancelled si se solicitó cancelar la tarea"""
+        if self.cancel_event.is_set():
+            raise TaskCancelled("Tarea cancelada por el usuario")
+
+    def progress(self, phase, done, total=0, bytes_done=0, bytes_total=0):
+        """Publica el avance de la fase actual (archivos y bytes procesados)"""
+        if self._progress is None:
+            return
+        now = time.monotonic()
+        if phase != self._phase:
+            self._phase = phase
+            self._phase_start = now
+        elif now - self._last_progress < self.PROGRESS_INTERVAL and not (total and done >= total):
+            return
+        self._last_progress = now
+        eta = None
+        elapsed = now - self._phase_start
+        if elapsed > 0:
+            if bytes_total and bytes_done:
+                eta = elapsed * (bytes_total - bytes_done) / bytes_done
+            elif total and done:
+                eta = elapsed * (total - done) / done
+        self._progress(Progress(phase, done, total, bytes_done, bytes_total, eta))
+
+
+def format_progress(progress):
+    """Texto breve de un Progress para la interfaz o la consola"""
+    text = f"{progress.phase}: {progress.done}"
+    if progress.total:
+        text += f"/{progress.total}"
+    text += " archivos"
+    if progress.bytes_total:
+        text += (f", {progress.bytes_done / (1024 * 1024):.1f}/"
+                 f"{progress.bytes_total / (1024 * 1024):.1f} MB")
+    if progress.eta is not None:
+        text += f", quedan {progress.eta:.0f} s"
+    return text
+
+
+# Operación de un plan: op es 'mkdir', 'move', 'rename', 'delete' o 'link';
+# reason describe el motivo ('duplicado' o 'temporal' en un borrado,
+# 'intermedio' en un paso a un nombre temporal), origin la ruta original
+# cuando source es un nombre temporal y digest el hash del contenido
+# ("algoritmo:hex") si se conoce
+Operation = namedtuple('Operation', ['op', 'source', 'target', 'size', 'reason', 'origin', 'digest'])
+
+
+class Plan:
+    """Lista de operaciones sobre el sistema de archivos calculada sin modificar nada"""
+
+    def __init__(self, task, folder):
+        self.task = task
+        self.folder = folder
+        self.operations = []
+        self.files_scanned = 0
+
+    def __len__(self):
+        return len(self.operations)
+
+    def __iter__(self):
+        return iter(self.operations)
+
+    def add(self, op, source, target=None, size=0, reason=None, origin=None, digest=None):
+        self.operations.append(Operation(op, source, target, size, reason, origin, digest))
+
+    def summary(self):
+        """Cuenta las operaciones por tipo"""
+        counts = {}
+        for operation in self.operations:
+            counts[operation.op] = counts.get(operation.op, 0) + 1
+        return counts
+
+
+def unique_name(name, taken, base=None):
+    """Devuelve name o una variante con sufijo _N que no esté en taken (comparación normalizada)"""
+    if os.path.normcase(name) not in taken:
+        return name
+    stem, ext = os.path.splitext(name)
+    base = base or stem
+    counter = 1
+    while True:
+        candidate = f"{base}_{counter}{ext}"
+        if os.path.normcase(candidate) not in taken:
+            return candidate
+        counter += 1
+
+
+def _entry_names(folder):
+    """Nombres normalizados de todas las entradas de una carpeta (una sola lectura)"""
+    with os.scandir(folder) as it:
+        return {os.path.normcase(entry.name) for entry in it}
+
+
+def plan_rename(folder, ctx=None):
+    """Planifica el renombrado de los archivos con numeración consistente.
+
+    Todo el mapeo se calcula en memoria a partir de una única lectura de la
+    carpeta: los nombres que se van a liberar no cuentan como ocupados y las
+    colisiones se resuelven con un conjunto en lugar de consultar el disco.
+    Si un destino es el nombre actual de otro archivo del lote (intercambios
+    o ciclos), el archivo pasa primero por un nombre temporal y se renombra
+    a su destino al final, cuando todos los nombres originales están libres.
+    """
+    ctx = ctx or TaskContext()
+    folder = os.path.abspath(folder)
+    plan = Plan('rename', folder)
+    names = set()
+    with ctx.metrics.phase('enumerar'):
+        files = list_files(folder, ctx.metrics, names)
+    plan.files_scanned = len(files)
+    sources = {os.path.normcase(entry.name) for entry in files}
+    # Nombres ocupados por entradas que no se renombran (carpetas, enlaces...)
+    taken = names - sources
+
+    mapping = []
+    for i, entry in enumerate(files, 1):
+        ext = os.path.splitext(entry.name)[1]
+        new_name = unique_name(f"documento_{i:03d}{ext}", taken, f"documento_{i:03d}")
+        taken.add(os.path.normcase(new_name))
+        if new_name != entry.name:
+            mapping.append((entry, new_name))
+
+    pending = {os.path.normcase(entry.name) for entry, new_name in mapping}
+    token = uuid.uuid4().hex[:8]
+    deferred = []
+    for i, (entry, new_name) in enumerate(mapping):
+        target = os.path.join(folder, new_name)
+        if os.path.normcase(new_name) not in pending:
+            plan.add('rename', entry.path, target, entry.size)
+            continue
+        temp_name = f".autotask-{token}-{i}{os.path.splitext(new_name)[1]}"
+        while os.path.normcase(temp_name) in names:
+            temp_name = "_" + temp_name
+        temp_path = os.path.join(folder, temp_name)
+        plan.add('rename', entry.path, temp_path, entry.size, 'intermedio')
+        deferred.append((temp_path, target, entry))
+
+    # Segunda fase: de los nombres temporales a los destinos ya liberados
+    for temp_path, target, entry in deferred:
+        plan.add('rename', temp_path, target, entry.size, origin=entry.path)
+    return plan
+
+
+def plan_organize(folder, files=None, ctx=None):
+    """Planifica la organización de los archivos en subcarpetas según su extensión.
+
+    Si no se indican files se organizan todos los archivos del primer nivel;
+    los archivos y los nombres ocupados salen de la misma lectura de la
+    carpeta.
+    """
+    ctx = ctx or TaskContext()
+    folder = os.path.abspath(folder)
+    plan = Plan('organize', folder)
+    with ctx.metrics.phase('enumerar'):
+        if files is None:
+            existing = set()
+            files = list_files(folder, ctx.metrics, existing)
+        else:
+            existing = _entry_names(folder)
+    plan.files_scanned = len(files)
+    # Nombres ocupados en cada subcarpeta de destino (se leen una sola vez)
+    taken_by_folder = {}
+
+    for entry in files:
+        file_ext = os.path.splitext(entry.name)[1].lower()
+        if not file_ext:
+            file_ext = "sin_extension"
+        else:
+            file_ext = file_ext[1:]  # Quitar el punto
+
+        type_folder = os.path.join(folder, file_ext)
+        taken = taken_by_folder.get(file_ext)
+        if taken is None:
+            if os.path.normcase(file_ext) in existing:
+                taken = _entry_names(type_folder)
+            else:
+                taken = set()
+                plan.add('mkdir', None, type_folder)
+            taken_by_folder[file_ext] = taken
+
+        # Evitar sobreescribir archivos existentes en la carpeta de destino
+        new_name = unique_name(entry.name, taken)
+        taken.add(os.path.normcase(new_name))
+        plan.add('move', entry.path, os.path.join(type_folder, new_name), entry.size)
+    return plan
+
+
+def open_hash_cache(path, ctx=None):
+    """Abre la caché de hashes o devuelve None (con un aviso) si no es posible"""
+    try:
+        return HashCache(path)
+    except Exception as e:
+        if ctx:
+            ctx.log(f"No se pudo abrir la caché de hashes: {str(e)}", "warning")
+        return None
+
+
+def plan_dedupe(folder, recursive=False, include=None, exclude=None, max_depth=None,
+                algorithm="md5", workers=DEFAULT_WORKERS, cache_path=None, verify=False,
+                mode='delete', ctx=None):
+    """Planifica el borrado de duplicados conservando la primera copia de cada grupo.
+
+    Con mode 'hardlink' o 'reflink' cada duplicado se sustituye por un enlace
+    al original en lugar de borrarse; los que ya son enlaces duros del
+    original se omiten.
+    """
+    if mode not in DEDUPE_MODES:
+        raise ValueError(f"Modo de duplicados desconocido: {mode}")
+    ctx = ctx or TaskContext()
+    folder = os.path.abspath(folder)
+    plan = Plan('dedupe', folder)
+
+    def on_scan_error(path, error):
+        ctx.log(f"No se pudo acceder a: {path}", "warning")
+
+    files = []
+    with ctx.metrics.phase('enumerar'):
+        for entry in scan_files(folder, recursive=recursive, include=include, exclude=exclude,
+                                max_depth=max_depth, on_error=on_scan_error, metrics=ctx.metrics):
+            files.append(entry)
+            ctx.check_cancelled()
+            ctx.progress("Analizando", len(files))
+    plan.files_scanned = len(files)
+    if not files:
+        return plan
+
+    def on_error(entry, error):
+        ctx.log(f"No se pudo leer el archivo: {os.path.relpath(entry.path, folder)}", "warning")
+
+    # Búsqueda por etapas: tamaño, hash parcial y hash completo
+    cache = open_hash_cache(cache_path, ctx) if cache_path else None
+    digests = {}
+    try:
+        groups = find_duplicates(files, algorithm=algorithm, workers=workers, cache=cache,
+                                 on_error=on_error, ctx=ctx, verify=verify, digests=digests)
+    finally:
+        if cache:
+            ctx.log(f"Caché de hashes: {cache.hits} reutilizados, {cache.misses} calculados")
+            cache.close()
+
+    for group in groups:
+        original = group[0]
+        for duplicate in group[1:]:
+            digest = digests.get(duplicate.path)
+            digest = digest and f"{algorithm}:{digest}"
+            if mode == 'delete':
+                plan.add('delete', duplicate.path, original.path, duplicate.size, 'duplicado',
+                         digest=digest)
+            elif duplicate.inode != original.inode or not _same_file(duplicate, original):
+                plan.add('link', duplicate.path, original.path, duplicate.size, mode, digest=digest)
+    return plan
+
+
+def _same_file(first, second):
+    """Indica si dos entradas son el mismo archivo (mismo inodo y dispositivo)"""
+    try:
+        return os.path.samefile(first.path, second.path)
+    except OSError:
+        return False
+
+
+def _walk_temporals(top, matcher, prune_re, now, ctx, first_level_only=False, on_error=None,
+                    report=True):
+    """Recorre un subárbol y devuelve (archivos examinados, [(ruta, tamaño)], subcarpetas).
+
+    Las carpetas que coinciden con prune_re se quitan de dirs en el propio
+    os.walk, de modo que nunca se enumeran. Solo se hace stat de los
+    archivos cuyo nombre coincide. Con first_level_only se examina solo la
+    carpeta top y se devuelven sus subcarpetas (ya podadas). La cancelación
+    se comprueba en cada carpeta; con report se publica el progreso.
+    """
+    scanned = 0
+    found = []
+    metrics = ctx.metrics
+    for root, dirs, files in os.walk(top, onerror=on_error):
+        ctx.check_cancelled()
+        metrics.count('scandir')
+        dirs[:] = [d for d in dirs if d != JOURNAL_DIR and not (
+            prune_re is not None and prune_re.match(os.path.normcase(d)))]
+        scanned += len(files)
+        for filename in files:
+            if not matcher.match_name(filename):
+                continue
+            path = os.path.join(root, filename)
+            start = time.perf_counter()
+            try:
+                metrics.count('stat')
+                st = os.lstat(path)
+            except OSError:
+                continue
+            finally:
+                metrics.add_time('stat', time.perf_counter() - start)
+            if matcher.match_stat(st, now):
+                found.append((path, st.st_size))
+        if report:
+            ctx.progress("Analizando", scanned)
+        if first_level_only:
+            return scanned, found, [os.path.join(root, d) for d in dirs]
+    return scanned, found, []
+
+
+def plan_clean(folder, matcher=None, prune=CLEAN_PRUNE_DIRS, workers=1, ctx=None):
+    """Planifica el borrado de archivos temporales y de backup en todo el árbol.
+
+    prune es una lista de nombres o patrones glob de carpetas que no se
+    recorren. Con workers > 1 cada subcarpeta del primer nivel se recorre
+    en un hilo distinto (os.scandir libera el GIL mientras lee la carpeta).
+    """
+    ctx = ctx or TaskContext()
+    matcher = matcher or DEFAULT_TEMP_MATCHER
+    prune_re = compile_patterns(prune)
+    now = time.time()
+    folder = os.path.abspath(folder)
+    plan = Plan('clean', folder)
+
+    def on_error(error):
+        ctx.log(f"No se pudo leer la carpeta: {error.filename} ({error.strerror})", "warning")
+
+    def add(result):
+        scanned, found, _ = result
+        plan.files_scanned += scanned
+        for path, size in found:
+            plan.add('delete', path, size=size, reason='temporal')
+
+    if workers <= 1:
+        add(_walk_temporals(folder, matcher, prune_re, now, ctx, on_error=on_error))
+        return plan
+
+    first_level = _walk_temporals(folder, matcher, prune_re, now, ctx, first_level_only=True,
+                                  on_error=on_error)
+    add(first_level)
+    results = {}
+    walks = map_bounded(lambda top: _walk_temporals(top, matcher, prune_re, now, ctx,
+                                                    on_error=on_error, report=False),
+                        first_level[2], workers)
+    for top, result, error in walks:
+        if error is not None:
+            raise error
+        results[top] = result
+        ctx.progress("Analizando carpetas", len(results), len(first_level[2]))
+    # Mantener el orden de recorrido independientemente de qué hilo termine antes
+    for top in first_level[2]:
+        add(results[top])
+    return plan
+
+
+def describe_operation(operation, folder):
+    """Texto del registro para una operación del plan"""
+    source = operation.origin or operation.source
+    source = os.path.relpath(source, folder) if source else None
+    if operation.op == 'mkdir':
+        return f"Creada carpeta: {os.path.relpath(operation.target, folder)}"
+    if operation.op == 'rename':
+        return f"Renombrado: {source} -> {os.path.basename(operation.target)}"
+    if operation.op == 'move':
+        return f"Movido: {source} -> {os.path.relpath(operation.target, folder)}"
+    if operation.op == 'link':
+        kind = "enlace duro" if operation.reason == 'hardlink' else "reflink"
+        return f"Sustituido por {kind}: {source} -> {os.path.relpath(operation.target, folder)}"
+    return f"Eliminado {operation.reason or 'archivo'}: {source}"
+
+
+def reflink(source, target):
+    """Crea target como clon de source que comparte sus bloques (copia bajo escritura).
+
+    Solo en Linux (ioctl FICLONE, p. ej. Btrfs o XFS); en otros sistemas
+    lanza OSError con EOPNOTSUPP.
+    """
+    if fcntl is None or not sys.platform.startswith('linux'):
+        raise OSError(errno.EOPNOTSUPP, "Reflink no disponible en este sistema")
+    with open(source, 'rb') as src, open(target, 'xb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def link_identity(path):
+    """Dispositivo, inodo, tamaño y mtime de path, para saber después si sigue siendo el mismo archivo"""
+    st = os.lstat(path)
+    return [st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns]
+
+
+def replace_with_link(path, original, use_reflink=False):
+    """Sustituye path por un enlace duro (o un reflink) a original de forma atómica.
+
+    El enlace se crea con un nombre temporal en la misma carpeta y después
+    os.replace lo pone en lugar de path, de modo que la ruta nunca deja de
+    existir. Un reflink conserva los metadatos (fechas, permisos) de path;
+    un enlace duro comparte los de original.
+    """
+    temp = os.path.join(os.path.dirname(path), f".autotask-{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        if use_reflink:
+            reflink(original, temp)
+            shutil.copystat(path, temp)
+        else:
+            os.link(original, temp)
+        os.replace(temp, path)
+    except BaseException:
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+        raise
+
+
+def move_across_devices(source, target):
+    """Mueve un archivo a otro sistema de archivos copiándolo y borrando el origen.
+
+    shutil.copyfile usa la copia sin búfer intermedio del sistema operativo
+    (sendfile/copy_file_range en Linux, fcopyfile en macOS) cuando existe.
+    """
+    try:
+        shutil.copyfile(source, target)
+        shutil.copystat(source, target)
+    except BaseException:
+        # No dejar copias a medias en el destino
+        try:
+            os.remove(target)
+        except OSError:
+            pass
+        raise
+    os.remove(source)
+
+
+# Acceso al diario de cada carpeta: varias ejecuciones simultáneas (pasos
+# paralelos de un pipeline, el vigilante) escriben en el mismo archivo
+_journal_guard = threading.Lock()
+_journal_locks = {}
+_active_runs = {}
+
+
+def _journal_lock(directory):
+    """Lock que serializa las escrituras y la poda del diario de una carpeta"""
+    key = os.path.normcase(os.path.abspath(directory))
+    with _journal_guard:
+        lock = _journal_locks.get(key)
+        if lock is None:
+            lock = _journal_locks[key] = threading.Lock()
+            _active_runs[key] = set()
+        return lock, _active_runs[key]
+
+
+def _read_journal(path):
+    """Lee el diario de deshacer y devuelve sus ejecuciones en orden.
+
+    Cada ejecución es su cabecera ('run', 'task', 'time') más la posición de
+    la cabecera en el archivo ('offset'), las líneas de sus operaciones sin
+    decodificar ('lines', asignadas por el identificador de ejecución con
+    que empieza cada una), los índices de las operaciones ya deshechas en
+    intentos anteriores ('restored') y si ya se deshizo por completo
+    ('undone'). Una última línea incompleta (corte durante una escritura)
+    se ignora.
+    """
+    runs = []
+    by_id = {}
+    offset = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            start = offset
+            offset += len(line)
+            if not line.endswith(b"\n"):
+                break
+            if line.startswith(b'["'):
+                run = by_id.get(line[2:line.find(b'"', 2)].decode('ascii', 'replace'))
+                if run is not None:
+                    run['lines'].append(line)
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            run = by_id.get(record.get('run'))
+            if 'undone' in record:
+                if run is not None:
+                    run['undone'] = True
+            elif 'restored' in record:
+                if run is not None:
+                    run['restored'].update(record['restored'])
+            elif 'run' in record:
+                record.update(offset=start, lines=[], restored=set(), undone=False)
+                runs.append(record)
+                by_id[record['run']] = record
+    return runs
+
+
+def _prune_journal(directory, keep, active=()):
+    """Descarta del diario y de la cuarentena las ejecuciones anteriores a las keep últimas.
+
+    Las ejecuciones de active (todavía en curso) se conservan siempre. Se
+    llama con el lock del diario adquirido.
+    """
+    path = os.path.join(directory, JOURNAL_FILE)
+    try:
+        runs = _read_journal(path)
+    except FileNotFoundError:
+        runs = []
+    first = max(0, len(runs) - keep)
+    for i, run in enumerate(runs[:first]):
+        if run['run'] in active:
+            first = i
+            break
+    kept = runs[first:]
+    if len(kept) < len(runs):
+        # Reescribir el diario a partir de la primera ejecución conservada
+        temp_path = path + ".tmp"
+        with open(path, 'rb') as src, open(temp_path, 'wb') as dst:
+            src.seek(kept[0]['offset'] if kept else 0, os.SEEK_SET if kept else os.SEEK_END)
+            shutil.copyfileobj(src, dst)
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(temp_path, path)
+    # Los archivos de las ejecuciones descartadas salen de la cuarentena
+    alive = {run['run'] for run in kept} | set(active)
+    try:
+        it = os.scandir(os.path.join(directory, QUARANTINE_DIR))
+    except OSError:
+        return
+    with it:
+        for entry in it:
+            if entry.name not in alive:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def _json_string(value):
+    return "null" if value is None else encode_basestring_ascii(value)
+
+
+class Journal:
+    """Diario de deshacer de una ejecución de apply_plan.
+
+    Se guarda en JOURNAL_DIR dentro de la carpeta de trabajo como líneas
+    JSON que solo se añaden: una cabecera por ejecución y una lista
+    [ejecución, op, origen, destino, tamaño, hash, identidad] por operación
+    (la identidad solo en las sustituciones por enlaces), con rutas
+    relativas a la carpeta; el identificador de la ejecución permite que
+    varias escriban a la vez en el mismo diario. Los registros se acumulan
+    en memoria y se escriben con un solo write (bajo el lock del diario de
+    la carpeta) cada BATCH_SIZE operaciones; el fsync se hace como mucho una
+    vez cada SYNC_INTERVAL segundos (y al cerrar), porque en muchos sistemas
+    de archivos obliga a confirmar también todos los renombrados pendientes
+    y es lo que más cuesta. Un corte de luz solo puede perder el último
+    segundo de registros. Los archivos borrados o sustituidos por enlaces
+    se conservan en la cuarentena de la ejecución (un rename o un enlace
+    duro en el mismo dispositivo, nunca una copia). Al empezar se descartan
+    las ejecuciones más antiguas que keep_runs.
+    """
+
+    BATCH_SIZE = 1000
+    SYNC_INTERVAL = 1.0
+
+    def __init__(self, folder, task, keep_runs=JOURNAL_KEEP_RUNS):
+        self.folder = os.path.abspath(folder)
+        self.directory = os.path.join(self.folder, JOURNAL_DIR)
+        self.path = os.path.join(self.directory, JOURNAL_FILE)
+        self.run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.quarantine = os.path.join(self.directory, QUARANTINE_DIR, self.run_id)
+        self.records = 0
+        self._unsynced = False
+        self._prefix = self.folder + os.sep
+        self._line_prefix = f"[{_json_string(self.run_id)},"
+        self._sequence = 0
+        self._pending = [json.dumps({'run': self.run_id, 'task': task, 'time': time.time()})]
+        self._last_sync = time.monotonic()
+        self._lock, self._active = _journal_lock(self.directory)
+        with self._lock:
+            _prune_journal(self.directory, keep_runs - 1, self._active)
+            self._active.add(self.run_id)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _relative(self, path):
+        if path is not None and path.startswith(self._prefix):
+            return path[len(self._prefix):]
+        return path
+
+    def record(self, op, source, target=None, size=0, digest=None, identity=None):
+        """Añade una operación ya aplicada (se escribe en lotes).
+
+        identity es la de link_identity() para el enlace que ocupa source
+        tras una sustitución: al deshacer solo se reemplaza si no cambió.
+        """
+        # Línea compuesta a mano: json.dumps por registro costaría varias veces más
+        identity = "null" if identity is None else "[" + ",".join(str(int(v)) for v in identity) + "]"
+        self._pending.append(f"{self._line_prefix}{_json_string(op)},"
+                             f"{_json_string(self._relative(source))},{_json_string(self._relative(target))},"
+                             f"{int(size)},{_json_string(digest)},{identity}]")
+        self.records += 1
+        if (len(self._pending) >= self.BATCH_SIZE
+                or time.monotonic() - self._last_sync >= self.SYNC_INTERVAL):
+            self.flush()
+
+    def quarantine_path(self, path):
+        """Nombre libre en la cuarentena para conservar path"""
+        if not self._sequence:
+            os.makedirs(self.quarantine, exist_ok=True)
+        self._sequence += 1
+        return os.path.join(self.quarantine, f"{self._sequence:06d}_{os.path.basename(path)}")
+
+    def flush(self, sync=False):
+        """Escribe los registros pendientes (con fsync si toca o si sync)"""
+        if not self.records:
+            # Una ejecución sin operaciones no deja rastro en el diario
+            return
+        now = time.monotonic()
+        sync = (sync or now - self._last_sync >= self.SYNC_INTERVAL) and (
+            self._pending or self._unsynced)
+        if not self._pending and not sync:
+            return
+        with self._lock:
+            # Se abre en cada escritura: otra ejecución puede haber podado el diario
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.path, 'a+b') as f:
+                if self._pending:
+                    data = ("\n".join(self._pending) + "\n").encode('ascii')
+                    if f.seek(0, os.SEEK_END):
+                        f.seek(-1, os.SEEK_END)
+                        if f.read(1) != b"\n":
+                            # Completar una línea cortada por una interrupción anterior
+                            data = b"\n" + data
+                    f.write(data)
+                    f.flush()
+                    self._pending = []
+                    self._unsynced = True
+                if sync:
+                    os.fsync(f.fileno())
+                    self._unsynced = False
+                    self._last_sync = now
+
+    def close(self):
+        """Escribe lo pendiente, lo lleva al disco y libera la ejecución"""
+        try:
+            self.flush(sync=True)
+        finally:
+            with self._lock:
+                self._active.discard(self.run_id)
+        if not self._sequence:
+            return
+        try:
+            # Cuarentena vacía si todas las operaciones fallaron
+            os.rmdir(self.quarantine)
+        except OSError:
+            pass
+
+
+def _format_rate(count, total_bytes, elapsed):
+    """Texto de velocidad en archivos/s y MB/s"""
+    elapsed = max(elapsed, 1e-6)
+    return f"{count / elapsed:.0f} archivos/s, {total_bytes / elapsed / (1024 * 1024):.1f} MB/s"
+
+
+def apply_plan(plan, ctx=None, dry_run=False, workers=DEFAULT_WORKERS, journal=None):
+    """Ejecuta un plan en una única fase.
+
+    Primero se crean de una vez todas las carpetas de destino y después se
+    aplican las operaciones en orden. Los movimientos dentro del mismo
+    sistema de archivos (mismo st_dev) son un simple os.rename; los que
+    cruzan de dispositivo se copian al final en paralelo con workers hilos.
+    Un fallo en una operación se registra como aviso y no detiene el resto.
+    Con dry_run solo se muestra el plan. La cancelación se atiende entre
+    operaciones, nunca con un archivo pendiente en un nombre intermedio; las
+    copias entre dispositivos ya empezadas terminan y se registran.
+    Con ctx.journal las operaciones se registran en un Journal y los
+    archivos borrados o sustituidos se conservan en la cuarentena, de modo
+    que undo_last_run puede deshacer la ejecución. Con journal (un Journal
+    abierto) las operaciones se añaden a esa ejecución, que no se cierra.
+    Devuelve el número de operaciones aplicadas (sin contar carpetas).
+    """
+    ctx = ctx or TaskContext()
+    with ctx.metrics.phase('aplicar'):
+        own = journal is None and ctx.journal and not dry_run and len(plan)
+        if own:
+            journal = Journal(plan.folder, plan.task)
+        try:
+            return _apply_operations(plan, ctx, dry_run, workers, None if dry_run else journal)
+        finally:
+            if own:
+                journal.close()
+
+
+def _quarantine(path, journal, metrics, link=False):
+    """Conserva path en la cuarentena (rename, o enlace duro con link) y devuelve la copia.
+
+    Si la cuarentena está en otro dispositivo no se puede conservar sin
+    copiarlo: se devuelve None y, salvo con link, el archivo se borra.
+    """
+    kept = journal.quarantine_path(path)
+    try:
+        if link:
+            metrics.count('link')
+            os.link(path, kept)
+        else:
+            metrics.count('rename')
+            os.rename(path, kept)
+        return kept
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    if not link:
+        metrics.count('remove')
+        os.remove(path)
+    return None
+
+
+def _apply_operations(plan, ctx, dry_run, workers, journal=None):
+    metrics = ctx.metrics
+    prefix = "[Simulación] " if dry_run else ""
+    start = time.perf_counter()
+
+    directories = [operation for operation in plan if operation.op == 'mkdir']
+    for operation in directories:
+        if not dry_run:
+            metrics.count('mkdir')
+            created = journal is not None and not os.path.isdir(operation.target)
+            os.makedirs(operation.target, exist_ok=True)
+            if created:
+                journal.record('mkdir', None, operation.target)
+        ctx.log(prefix + describe_operation(operation, plan.folder))
+
+    # st_dev por carpeta, consultado una sola vez
+    devices = {}
+
+    def device(path):
+        directory = os.path.dirname(path)
+        if directory not in devices:
+            metrics.count('stat')
+            devices[directory] = os.stat(directory).st_dev
+        return devices[directory]
+
+    def cancelled(done, total):
+        ctx.log(f"Tarea cancelada tras aplicar {done} de {total} operaciones.", "warning")
+        return TaskCancelled("Tarea cancelada por el usuario")
+
+    total = len(plan) - len(directories)
+    applied = 0
+    failed = 0
+    total_bytes = 0
+    cross_device = []
+    # Nombres intermedios de intercambios todavía sin resolver
+    intermediate = set()
+    for done, operation in enumerate(operation for operation in plan if operation.op != 'mkdir'):
+        if ctx.cancelled and not intermediate:
+            raise cancelled(applied, total)
+        ctx.progress("Aplicando", done, total)
+        intermediate.discard(operation.source)
+        kept = None
+        identity = None
+        try:
+            if not dry_run:
+                if operation.op == 'rename':
+                    metrics.count('rename')
+                    os.rename(operation.source, operation.target)
+                elif operation.op == 'move':
+                    if device(operation.source) != device(operation.target):
+                        cross_device.append(operation)
+                        continue
+                    metrics.count('rename')
+                    os.rename(operation.source, operation.target)
+                elif operation.op == 'delete':
+                    if journal is not None:
+                        kept = _quarantine(operation.source, journal, metrics)
+                    else:
+                        metrics.count('remove')
+                        os.remove(operation.source)
+                elif operation.op == 'link':
+                    if journal is not None:
+                        kept = _quarantine(operation.source, journal, metrics, link=True)
+                    metrics.count('link')
+                    try:
+                        replace_with_link(operation.source, operation.target,
+                                          operation.reason == 'reflink')
+                    except BaseException:
+                        if kept:
+                            os.remove(kept)
+                        raise
+                    if journal is not None:
+                        metrics.count('stat')
+                        identity = link_identity(operation.source)
+                else:
+                    raise ValueError(f"Operación desconocida: {operation.op}")
+        except OSError as e:
+            failed += 1
+            ctx.log(f"No se pudo aplicar '{describe_operation(operation, plan.folder)}': {str(e)}",
+                    "warning")
+            continue
+        if journal is not None:
+            journal.record(operation.op, operation.source,
+                           kept if operation.op in ('delete', 'link') else operation.target,
+                           operation.size, operation.digest, identity)
+        if operation.reason == 'intermedio':
+            intermediate.add(operation.target)
+            continue
+        applied += 1
+        if operation.op in ('delete', 'link'):
+            if not dry_run and operation.reason in ('duplicado', 'temporal', 'hardlink', 'reflink'):
+                metrics.count('bytes_recuperados', operation.size)
+        else:
+            total_bytes += operation.size
+        ctx.log(prefix + describe_operation(operation, plan.folder))
+    ctx.progress("Aplicando", total - len(cross_device), total)
+
+    if cross_device:
+        copy_start = time.perf_counter()
+        copied = 0
+        copied_bytes = 0
+        cross_bytes = sum(operation.size for operation in cross_device)
+
+        def move(operation):
+            # Tras cancelar no empieza ninguna copia nueva; las que están en curso terminan
+            ctx.check_cancelled()
+            move_across_devices(operation.source, operation.target)
+
+        skipped = 0
+        for operation, result, error in map_bounded(move, cross_device, workers):
+            ctx.progress("Copiando", copied, len(cross_device), copied_bytes, cross_bytes)
+            if isinstance(error, TaskCancelled):
+                skipped += 1
+                continue
+            if error is not None:
+                if not isinstance(error, OSError):
+                    raise error
+                failed += 1
+                ctx.log(f"No se pudo aplicar '{describe_operation(operation, plan.folder)}': "
+                        f"{str(error)}", "warning")
+                continue
+            copied += 1
+            copied_bytes += operation.size
+            if journal is not None:
+                journal.record('move', operation.source, operation.target, operation.size,
+                               operation.digest)
+            ctx.log(describe_operation(operation, plan.folder))
+        metrics.add_time('copiar', time.perf_counter() - copy_start)
+        metrics.count('copy', copied)
+        metrics.count('bytes_copiados', copied_bytes)
+        ctx.log(f"Copiados entre dispositivos {copied} archivos con {max(1, workers)} hilos "
+                f"({_format_rate(copied, copied_bytes, time.perf_counter() - copy_start)})")
+        applied += copied
+        total_bytes += copied_bytes
+        if skipped:
+            # Cada copia terminada ya quedó registrada y en el diario
+            raise cancelled(applied, total)
+
+    elapsed = time.perf_counter() - start
+    if dry_run:
+        ctx.log(f"Simulación: {applied} operaciones planificadas, no se modificó ningún archivo.")
+    elif applied:
+        ctx.log(f"Aplicadas {applied} operaciones en {elapsed:.2f} s "
+                f"({_format_rate(applied, total_bytes, elapsed)})"
+                + (f", {failed} fallidas" if failed else ""))
+    return applied
+
+
+def rename_files(folder, dry_run=False, ctx=None):
+    """Renombra los archivos de la carpeta con numeración consistente"""
+    ctx = ctx or TaskContext()
+    ctx.log("Iniciando renombrado de archivos...")
+    plan = plan_rename(folder, ctx)
+    ctx.metrics.count('archivos', plan.files_scanned)
+
+    if not plan.files_scanned:
+        ctx.log("No se encontraron archivos para renombrar", "warning")
+        return 0
+
+    count = apply_plan(plan, ctx, dry_run)
+    if not dry_run:
+        ctx.log("Renombrado completado exitosamente.", "success")
+    return count
+
+
+def organize_by_type(folder, dry_run=False, workers=DEFAULT_WORKERS, ctx=None):
+    """Organiza los archivos de la carpeta en subcarpetas según su extensión"""
+    ctx = ctx or TaskContext()
+    ctx.log("Organizando archivos por tipo...")
+    plan = plan_organize(folder, ctx=ctx)
+    ctx.metrics.count('archivos', plan.files_scanned)
+
+    if not plan.files_scanned:
+        ctx.log("No se encontraron archivos para organizar", "warning")
+        return 0
+
+    count = apply_plan(plan, ctx, dry_run, workers)
+    if not dry_run:
+        ctx.log("Organización completada exitosamente.", "success")
+    return count
+
+
+def remove_duplicates(folder, dry_run=False, ctx=None, **options):
+    """Elimina los archivos duplicados conservando la primera copia de cada grupo.
+
+    Las opciones se pasan a plan_dedupe.
+    """
+    ctx = ctx or TaskContext()
+    ctx.log("Buscando y eliminando archivos duplicados...")
+    plan = plan_dedupe(folder, ctx=ctx, **options)
+    ctx.metrics.count('archivos', plan.files_scanned)
+
+    if not plan.files_scanned:
+        ctx.log("No se encontraron archivos para analizar", "warning")
+        return 0
+
+    duplicates_count = apply_plan(plan, ctx, dry_run)
+    if dry_run:
+        reclaimable = sum(operation.size for operation in plan)
+        ctx.log(f"Simulación: se recuperarían {reclaimable / (1024 * 1024):.1f} MB")
+        return duplicates_count
+    reclaimed = ctx.metrics.counters.get('bytes_recuperados', 0)
+    action = "se eliminaron" if options.get('mode', 'delete') == 'delete' else "se enlazaron"
+    # Con el diario los archivos siguen en la cuarentena hasta que se descarta la ejecución
+    recovered = "se liberarán al descartar la cuarentena" if ctx.journal else "recuperados"
+    ctx.log(
+        f"Eliminación de duplicados completada: {action} {duplicates_count} archivos, "
+        f"{reclaimed / (1024 * 1024):.1f} MB {recovered}.",
+        "success" if duplicates_count > 0 else "info"
+    )
+    return duplicates_count
+
+
+def clean_temporals(folder, dry_run=False, extensions=TEMP_EXTENSIONS, patterns=None,
+                    min_age_days=None, min_size=None, max_size=None, prune=CLEAN_PRUNE_DIRS,
+                    workers=1, ctx=None):
+    """Elimina los archivos temporales y de backup de la carpeta y sus subcarpetas"""
+    ctx = ctx or TaskContext()
+    ctx.log("Limpiando archivos temporales...")
+    start = time.perf_counter()
+    matcher = TempMatcher(extensions, patterns, min_age_days, min_size, max_size)
+    with ctx.metrics.phase('enumerar'):
+        plan = plan_clean(folder, matcher, prune, workers, ctx)
+    ctx.metrics.count('archivos', plan.files_scanned)
+    ctx.log(f"Examinados {plan.files_scanned} archivos en {time.perf_counter() - start:.2f} s "
+            f"({len(plan)} temporales)")
+
+    deleted_count = apply_plan(plan, ctx, dry_run)
+    if not dry_run:
+        ctx.log(
+            f"Limpieza completada. Se eliminaron {deleted_count} archivos temporales.",
+            "success" if deleted_count > 0 else "info"
+        )
+    return deleted_count
+
+
+def _restore(source, target):
+    """Devuelve a target un archivo movido a source (copiándolo si cambió de dispositivo)"""
+    try:
+        os.rename(source, target)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        move_across_devices(source, target)
+
+
+def _mark_undo(directory, record):
+    """Añade al diario el resultado de un intento de deshacer"""
+    with _journal_lock(directory)[0], open(os.path.join(directory, JOURNAL_FILE), 'ab') as f:
+        f.write((json.dumps(record) + "\n").encode('ascii'))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def undo_last_run(folder, dry_run=False, ctx=None):
+    """Deshace la última ejecución del diario de la carpeta que no se haya deshecho ya.
+
+    Las operaciones se recorren en orden inverso: los archivos renombrados o
+    movidos vuelven a su ruta, los borrados y los sustituidos por enlaces se
+    recuperan de la cuarentena y las carpetas creadas se eliminan si quedaron
+    vacías. Nunca se sobrescribe un archivo que ocupe la ruta original.
+    Si alguna operación falla o se cancela, el diario guarda cuáles se
+    deshicieron y la ejecución sigue pendiente: un nuevo intento solo repite
+    las que faltan. Los borrados que no pasaron por la cuarentena no se
+    pueden recuperar y no se reintentan.
+    """
+    ctx = ctx or TaskContext()
+    directory = os.path.join(folder, JOURNAL_DIR)
+    try:
+        runs = [run for run in _read_journal(os.path.join(directory, JOURNAL_FILE)) if not run['undone']]
+    except FileNotFoundError:
+        runs = []
+    if not runs:
+        ctx.log("No hay ninguna ejecución que deshacer en esta carpeta", "warning")
+        return 0
+
+    run = runs[-1]
+    if run['run'] in _journal_lock(directory)[1]:
+        ctx.log("La última ejecución sigue en curso (por ejemplo, la vigilancia de la carpeta); "
+                "deténgala antes de deshacerla", "warning")
+        return 0
+    operations = []
+    for index, line in enumerate(run['lines']):
+        if index in run['restored']:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        # Los registros sin identidad se completan con None
+        operations.append((index, record + [None] * (7 - len(record))))
+    task = run.get('task', "tarea")
+    description = TASKS[task][1] if task in TASKS else ("la vigilancia" if task == 'watch' else task)
+    started = time.strftime('%d/%m/%Y %H:%M:%S', time.localtime(run.get('time', 0)))
+    ctx.log(f"Deshaciendo {description} del {started} ({len(operations)} operaciones)...")
+
+    def absolute(path):
+        return path if path is None else os.path.join(folder, path)
+
+    prefix = "[Simulación] " if dry_run else ""
+    restored = 0
+    failed = 0
+    lost = 0
+    # Índices de las operaciones resueltas en este intento
+    resolved = []
+    total = len(operations)
+    with ctx.metrics.phase('deshacer'):
+        for done, (index, (_, op, source, target, size, digest, identity)) in enumerate(
+                reversed(operations)):
+            if ctx.cancelled:
+                if resolved and not dry_run:
+                    _mark_undo(directory, {'run': run['run'], 'restored': resolved})
+                ctx.log(f"Se detuvo tras deshacer {restored} de {total} operaciones; "
+                        f"la ejecución sigue en el diario.", "warning")
+                raise TaskCancelled("Tarea cancelada por el usuario")
+            ctx.progress("Deshaciendo", done, total)
+            source, target = absolute(source), absolute(target)
+            if op == 'mkdir':
+                if not dry_run:
+                    resolved.append(index)
+                    try:
+                        ctx.metrics.count('remove')
+                        os.rmdir(target)
+                    except OSError:
+                        continue   # no está vacía: se conserva
+                ctx.log(prefix + f"Eliminada carpeta creada: {os.path.relpath(target, folder)}")
+                continue
+            if op in ('delete', 'link'):
+                message = f"Recuperado de la cuarentena: {os.path.relpath(source, folder)}"
+            else:
+                message = f"Restaurado: {os.path.relpath(target, folder)} -> {os.path.relpath(source, folder)}"
+            if target is None:
+                lost += 1
+                resolved.append(index)
+                ctx.log(f"No se puede deshacer '{message}': se eliminó sin pasar por la cuarentena",
+                        "warning")
+                continue
+            try:
+                if not os.path.lexists(target):
+                    raise OSError(errno.ENOENT, "ya no existe", target)
+                if os.path.lexists(source) and (op != 'link' or identity is None
+                                                or link_identity(source) != identity):
+                    # Un enlace solo se sustituye si nadie lo cambió ni lo reemplazó
+                    raise OSError(errno.EEXIST, "la ruta original está ocupada", source)
+                if not dry_run:
+                    ctx.metrics.count('rename')
+                    if op == 'link':
+                        # El enlace ocupa la ruta: se sustituye por el archivo conservado
+                        os.replace(target, source)
+                    else:
+                        _restore(target, source)
+            except OSError as e:
+                failed += 1
+                ctx.log(f"No se pudo deshacer '{message}': {str(e)}", "warning")
+                continue
+            restored += 1
+            resolved.append(index)
+            ctx.log(prefix + message)
+    ctx.progress("Deshaciendo", total, total)
+
+    if dry_run:
+        ctx.log(f"Simulación: se desharían {restored} operaciones, no se modificó ningún archivo.")
+        return restored
+    if failed:
+        # La ejecución sigue pendiente: se anotan las operaciones ya resueltas
+        _mark_undo(directory, {'run': run['run'], 'restored': resolved})
+        ctx.log(f"Se deshizo en parte {description}: {restored} operaciones restauradas, {failed} "
+                f"no se pudieron deshacer (se pueden reintentar con otra reversión).", "warning")
+        return restored
+    _mark_undo(directory, {'run': run['run'], 'undone': time.time()})
+    shutil.rmtree(os.path.join(directory, QUARANTINE_DIR, run['run']), ignore_errors=True)
+    ctx.log(f"Se deshizo {description}: {restored} operaciones restauradas"
+            + (f", {lost} no se pudieron recuperar." if lost else "."),
+            "warning" if lost else "success")
+    return restored
+
+
+# Tareas disponibles: nombre -> (función, descripción para los mensajes de error)
+TASKS = {
+    'rename': (rename_files, "el renombrado"),
+    'organize': (organize_by_type, "la organización"),
+    'dedupe': (remove_duplicates, "la eliminación de duplicados"),
+    'clean': (clean_temporals, "la limpieza"),
+    'undo': (undo_last_run, "la reversión de la última ejecución"),
+}
+
+
+def run_task(name, folder, ctx=None, **options):
+    """Ejecuta una tarea por nombre registrando cualquier error en el contexto.
+
+    Devuelve el número de archivos procesados, o None si la tarea falló.
+    """
+    ctx = ctx or TaskContext()
+    func, description = TASKS[name]
+    ctx.metrics = Metrics()
+    profiler = TaskProfiler() if ctx.profile_dir else None
+    if profiler:
+        profiler.start()
+    try:
+        result = func(folder, ctx=ctx, **options)
+    except TaskCancelled:
+        ctx.log(f"Se canceló {description}.", "warning")
+        result = None
+    except Exception as e:
+        ctx.log(f"Error durante {description}: {str(e)}", "error")
+        result = None
+    if profiler:
+        profiler.stop()
+        _save_profile(profiler, name, folder, ctx)
+    _report_metrics(name, description, folder, result, ctx)
+    return result
+
+
+class TaskProfiler:
+    """Perfilado opcional de una ejecución con cProfile y tracemalloc.
+
+    cProfile solo mide el hilo que ejecuta la tarea (no los hilos de hash o
+    de copia). tracemalloc es global: si ya está activo no se detiene al
+    terminar.
+    """
+
+    def __init__(self):
+        # Se importan aquí: el perfilado es opcional y no debe retrasar el arranque
+        import cProfile
+        import tracemalloc
+        self.profile = cProfile.Profile()
+        self.owns_tracemalloc = not tracemalloc.is_tracing()
+        self.snapshot = None
+        self.peak = None
+
+    def start(self):
+        import tracemalloc
+        if self.owns_tracemalloc:
+            tracemalloc.start(10)
+        self.profile.enable()
+
+    def stop(self):
+        import tracemalloc
+        self.profile.disable()
+        self.peak = tracemalloc.get_traced_memory()[1]
+        self.snapshot = tracemalloc.take_snapshot()
+        if self.owns_tracemalloc:
+            tracemalloc.stop()
+
+    def report(self, limit=40):
+        """Texto del informe: funciones con más tiempo acumulado y mayores reservas de memoria"""
+        import pstats
+        out = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=out)
+        stats.sort_stats('cumulative').print_stats(limit)
+        out.write(f"\nMemoria máxima reservada por Python: {self.peak / (1024 * 1024):.1f} MB\n")
+        out.write("Líneas con más memoria reservada al terminar:\n")
+        for stat in self.snapshot.statistics('lineno')[:15]:
+            out.write(f"  {stat}\n")
+        return out.getvalue()
+
+
+def _save_profile(profiler, name, folder, ctx):
+    """Guarda el informe de perfilado en ctx.profile_dir"""
+    path = os.path.join(ctx.profile_dir,
+                        f"autotask_perfil_{name}_{time.strftime('%Y%m%d_%H%M%S')}.txt")
+    try:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"Tarea: {name}\nCarpeta: {folder}\n\n{profiler.report()}")
+    except OSError as e:
+        ctx.log(f"No se pudo guardar el informe de perfilado: {str(e)}", "warning")
+        return
+    ctx.log(f"Informe de perfilado guardado en: {path}")
+
+
+def _report_metrics(name, description, folder, result, ctx):
+    """Registra la línea de resumen y, si se indica, añade las métricas a ctx.metrics_file"""
+    # "de el renombrado" -> "del renombrado"
+    of = "del " + description[3:] if description.startswith("el ") else "de " + description
+    ctx.log(f"Métricas {of}: {ctx.metrics.summary()}")
+    if not ctx.metrics_file:
+        return
+    record = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'task': name, 'folder': folder,
+              'ok': result is not None, 'count': result}
+    record.update(ctx.metrics.to_dict())
+    try:
+        with open(ctx.metrics_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError as e:
+        ctx.log(f"No se pudieron guardar las métricas: {str(e)}", "warning")
+
+
+def folders_overlap(first, second):
+    """Indica si dos carpetas son la misma o una contiene a la otra"""
+    first = os.path.normcase(os.path.abspath(first))
+    second = os.path.normcase(os.path.abspath(second))
+    try:
+        return os.path.commonpath([first, second]) in (first, second)
+    except ValueError:
+        # Unidades distintas en Windows
+        return False
+
+
+class TaskHandle:
+    """Tarea lanzada por un TaskManager"""
+
+    def __init__(self, label, folder, ctx):
+        self.label = label
+        self.folder = folder
+        self.ctx = ctx
+        self.running = False
+        self.done_event = threading.Event()
+
+    def cancel(self):
+        """Solicita cancelar la tarea, esté esperando o en ejecución"""
+        self.ctx.cancel()
+
+    def wait(self, timeout=None):
+        """Espera a que la tarea termine"""
+        return self.done_event.wait(timeout)
+
+
+class TaskManager:
+    """Ejecuta tareas en hilos y serializa las que afectan a carpetas solapadas.
+
+    Dos tareas entran en conflicto si trabajan sobre la misma carpeta o una
+    contiene a la otra; la segunda espera a que termine la primera. Las
+    tareas sobre carpetas independientes se ejecutan a la vez. Una tarea
+    cancelada mientras espera no llega a ejecutarse.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.tasks = []
+
+    def active_tasks(self):
+        """Tareas en espera o en ejecución"""
+        with self.condition:
+            return list(self.tasks)
+
+    def cancel(self, handle=None):
+        """Cancela una tarea, o todas las activas si no se indica"""
+        for task in self.active_tasks():
+            if handle is None or task is handle:
+                task.cancel()
+
+    def submit(self, label, folder, func, ctx=None):
+        """Lanza func(ctx) en un hilo cuando la carpeta quede libre y devuelve su TaskHandle"""
+        handle = TaskHandle(label, folder, ctx or TaskContext())
+        with self.condition:
+            waiting = any(folders_overlap(task.folder, folder) for task in self.tasks)
+            self.tasks.append(handle)
+        if waiting:
+            handle.ctx.log(f"En espera de otra tarea sobre la misma carpeta: {label}", "warning")
+        threading.Thread(target=self._run, args=(handle, func), daemon=True).start()
+        return handle
+
+    def _run(self, handle, func):
+        try:
+            with self.condition:
+                # Esperar a las tareas anteriores que comparten carpeta
+                while not handle.ctx.cancelled and any(
+                        folders_overlap(task.folder, handle.folder)
+                        for task in self.tasks[:self.tasks.index(handle)]):
+                    self.condition.wait(0.2)
+                handle.running = not handle.ctx.cancelled
+            if handle.running:
+                func(handle.ctx)
+            else:
+                handle.ctx.log(f"Se canceló {handle.label} antes de empezar.", "warning")
+        except Exception as e:
+            handle.ctx.log(f"Error durante {handle.label}: {str(e)}", "error")
+        finally:
+            with self.condition:
+                self.tasks.remove(handle)
+                self.condition.notify_all()
+            handle.running = False
+            handle.done_event.set()
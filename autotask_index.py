@@ -0,0 +1,344 @@
+"""Índice persistente de carpetas para previsualizar las tareas sin recorrerlas"""
+import os
+import sys
+import time
+import struct
+import hashlib
+from array import array
+from collections import namedtuple
+
+from autotask_engine import (TaskContext, DEFAULT_WORKERS, DEFAULT_TEMP_MATCHER, CLEAN_PRUNE_DIRS,
+                             JOURNAL_DIR, compile_patterns, hash_file_partial, map_bounded)
+
+# Carpeta donde se guardan las instantáneas (un archivo por carpeta indexada)
+INDEX_DIR = "autotask_index"
+
+INDEX_MAGIC = b'ATIX'
+INDEX_VERSION = 1
+# Cabecera: firma, versión, orden de bytes, fecha de actualización y número de carpetas,
+# archivos, extensiones y bytes de la tabla de nombres
+INDEX_HEADER = struct.Struct('<4sHBxdIIII')
+# Hash parcial (MD5 del principio y el final) guardado por archivo; ceros = sin calcular
+DIGEST_SIZE = 16
+NO_DIGEST = bytes(DIGEST_SIZE)
+
+IndexPreview = namedtuple('IndexPreview', 'files total_bytes extensions duplicate_groups '
+                                          'duplicate_files duplicate_bytes temp_files temp_bytes')
+_Stat = namedtuple('_Stat', 'st_size st_mtime')
+
+
+def _partial_digest(path, size):
+    return bytes.fromhex(hash_file_partial(path, size, "md5"))
+
+
+class FolderIndex:
+    """Instantánea compacta de un árbol de carpetas.
+
+    Los archivos se guardan en columnas (array) en lugar de un objeto por
+    archivo: carpeta, extensión, tamaño, mtime y hash parcial, más la lista
+    de nombres. De cada carpeta se guarda su mtime: refresh() solo vuelve a
+    leer las carpetas cuyo mtime cambió (se creó, borró o renombró algo en
+    ellas) y conserva el resto tal cual. Un archivo modificado sin cambiar
+    de nombre no altera el mtime de su carpeta, por lo que la vista previa
+    es orientativa; las tareas siempre recorren la carpeta de nuevo.
+    """
+
+    def __init__(self, folder):
+        self.folder = os.path.abspath(folder)
+        self.refreshed = 0.0
+        self.dirs = []                  # rutas relativas; '' es la carpeta raíz
+        self.dir_mtimes = array('q')
+        self.exts = []
+        self.names = []
+        self.file_dirs = array('I')
+        self.file_exts = array('I')
+        self.sizes = array('q')
+        self.mtimes = array('q')
+        self.digests = bytearray()
+        self._ext_ids = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def _append(self, dir_id, name, size, mtime_ns, digest=NO_DIGEST):
+        ext = os.path.splitext(name)[1].lower()
+        ext_id = self._ext_ids.get(ext)
+        if ext_id is None:
+            ext_id = self._ext_ids[ext] = len(self.exts)
+            self.exts.append(ext)
+        self.names.append(name)
+        self.file_dirs.append(dir_id)
+        self.file_exts.append(ext_id)
+        self.sizes.append(size)
+        self.mtimes.append(mtime_ns)
+        self.digests += digest
+
+    def digest(self, i):
+        """Hash parcial del archivo i (NO_DIGEST si no se calculó)"""
+        return bytes(self.digests[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE])
+
+    def path(self, i):
+        """Ruta absoluta del archivo i"""
+        return os.path.join(self.folder, self.dirs[self.file_dirs[i]], self.names[i])
+
+    def refresh(self, workers=DEFAULT_WORKERS, ctx=None):
+        """Actualiza el índice releyendo solo las carpetas modificadas.
+
+        Devuelve el número de carpetas leídas de nuevo. Al final se calcula
+        el hash parcial de los archivos nuevos cuyo tamaño coincide con el
+        de otro archivo (los únicos que pueden ser duplicados).
+        """
+        ctx = ctx or TaskContext()
+        files_by_dir = {}
+        for i, dir_id in enumerate(self.file_dirs):
+            files_by_dir.setdefault(dir_id, []).append(i)
+        known = {rel: dir_id for dir_id, rel in enumerate(self.dirs)}
+        children = {}
+        for rel in self.dirs:
+            if rel:
+                children.setdefault(os.path.dirname(rel), []).append(rel)
+
+        new = FolderIndex(self.folder)
+        rescanned = 0
+        stack = ['']
+        while stack:
+            ctx.check_cancelled()
+            rel = stack.pop()
+            path = os.path.join(self.folder, rel)
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            dir_id = len(new.dirs)
+            new.dirs.append(rel)
+            new.dir_mtimes.append(mtime)
+            old_id = known.get(rel)
+            old_files = files_by_dir.get(old_id, ())
+            if old_id is not None and self.dir_mtimes[old_id] == mtime:
+                # Carpeta sin cambios: se copian sus registros sin leerla
+                for i in old_files:
+                    new._append(dir_id, self.names[i], self.sizes[i], self.mtimes[i], self.digest(i))
+                stack.extend(reversed(children.get(rel, ())))
+                continue
+
+            rescanned += 1
+            ctx.progress("Indexando", rescanned)
+            previous = {self.names[i]: i for i in old_files}
+            subdirs = []
+            try:
+                it = os.scandir(path)
+            except OSError:
+                new.dir_mtimes[dir_id] = -1   # volver a intentarlo en la próxima actualización
+                continue
+            with it:
+                for item in it:
+                    try:
+                        if item.is_dir(follow_symlinks=False):
+                            if item.name != JOURNAL_DIR:
+                                subdirs.append(os.path.join(rel, item.name))
+                            continue
+                        if not item.is_file(follow_symlinks=False):
+                            continue
+                        st = item.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    digest = NO_DIGEST
+                    i = previous.get(item.name)
+                    if i is not None and (self.sizes[i], self.mtimes[i]) == (st.st_size, st.st_mtime_ns):
+                        digest = self.digest(i)
+                    new._append(dir_id, item.name, st.st_size, st.st_mtime_ns, digest)
+            stack.extend(reversed(subdirs))
+
+        new._fill_digests(workers, ctx)
+        new.refreshed = time.time()
+        self.__dict__.update(new.__dict__)
+        return rescanned
+
+    def _fill_digests(self, workers, ctx):
+        counts = {}
+        for size in self.sizes:
+            counts[size] = counts.get(size, 0) + 1
+        missing = [i for i, size in enumerate(self.sizes)
+                   if size and counts[size] > 1 and self.digest(i) == NO_DIGEST]
+        done = 0
+        for i, digest, error in map_bounded(
+                lambda i: _partial_digest(self.path(i), self.sizes[i]), missing, workers):
+            ctx.check_cancelled()
+            done += 1
+            ctx.progress("Indexando hashes", done, len(missing))
+            if error is None:
+                self.digests[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE] = digest
+
+    def preview(self, recursive=True, matcher=None, prune=CLEAN_PRUNE_DIRS):
+        """Resumen de lo que harían las tareas según el índice.
+
+        Cuenta los archivos por extensión, los grupos de duplicados esperados
+        (mismo tamaño y hash parcial; solo el primer nivel si recursive es
+        False) y los temporales según matcher, sin entrar en las carpetas de
+        prune, igual que la limpieza.
+        """
+        matcher = matcher or DEFAULT_TEMP_MATCHER
+        prune_re = compile_patterns(prune)
+        # Las carpetas se añaden antes que sus subcarpetas
+        pruned = []
+        dir_ids = {}
+        for dir_id, rel in enumerate(self.dirs):
+            dir_ids[rel] = dir_id
+            if not rel:
+                pruned.append(False)
+                continue
+            parent = dir_ids.get(os.path.dirname(rel))
+            own = prune_re is not None and prune_re.match(os.path.normcase(os.path.basename(rel))) is not None
+            pruned.append(own or (parent is not None and pruned[parent]))
+
+        extensions = {}
+        groups = {}
+        temp_files = temp_bytes = 0
+        now = time.time()
+        for i, name in enumerate(self.names):
+            size = self.sizes[i]
+            dir_id = self.file_dirs[i]
+            ext = self.exts[self.file_exts[i]]
+            count, total = extensions.get(ext, (0, 0))
+            extensions[ext] = (count + 1, total + size)
+            if (not pruned[dir_id] and matcher.match_name(name)
+                    and matcher.match_stat(_Stat(size, self.mtimes[i] / 1e9), now)):
+                temp_files += 1
+                temp_bytes += size
+            if recursive or dir_id == 0:
+                # Los archivos vacíos son todos iguales entre sí, como en find_duplicates
+                digest = self.digest(i)
+                if digest != NO_DIGEST or not size:
+                    key = (size, digest)
+                    groups[key] = groups.get(key, 0) + 1
+
+        duplicates = [(size, count) for (size, _), count in groups.items() if count > 1]
+        return IndexPreview(
+            files=len(self.names), total_bytes=sum(self.sizes), extensions=extensions,
+            duplicate_groups=len(duplicates),
+            duplicate_files=sum(count - 1 for size, count in duplicates),
+            duplicate_bytes=sum((count - 1) * size for size, count in duplicates),
+            temp_files=temp_files, temp_bytes=temp_bytes
+        )
+
+    def to_bytes(self):
+        """Serializa el índice: cabecera, tabla de nombres y columnas"""
+        strings = "\0".join([self.folder] + self.dirs + self.exts + self.names).encode(
+            'utf-8', 'surrogateescape')
+        header = INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, sys.byteorder == 'big', self.refreshed,
+                                   len(self.dirs), len(self.names), len(self.exts), len(strings))
+        return b"".join([header, strings, self.dir_mtimes.tobytes(), self.file_dirs.tobytes(),
+                         self.file_exts.tobytes(), self.sizes.tobytes(), self.mtimes.tobytes(),
+                         bytes(self.digests)])
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Reconstruye un índice serializado con to_bytes (ValueError si no es válido)"""
+        try:
+            magic, version, big_endian, refreshed, n_dirs, n_files, n_exts, strings_len = \
+                INDEX_HEADER.unpack_from(data)
+        except struct.error:
+            raise ValueError("Índice de carpeta truncado")
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError("Formato de índice de carpeta no reconocido")
+        offset = INDEX_HEADER.size
+        strings = data[offset:offset + strings_len].decode('utf-8', 'surrogateescape').split("\0")
+        offset += strings_len
+        if len(strings) != 1 + n_dirs + n_exts + n_files:
+            raise ValueError("Índice de carpeta dañado")
+
+        index = cls(strings[0])
+        index.refreshed = refreshed
+        index.dirs = strings[1:1 + n_dirs]
+        index.exts = strings[1 + n_dirs:1 + n_dirs + n_exts]
+        index.names = strings[1 + n_dirs + n_exts:]
+        index._ext_ids = {ext: ext_id for ext_id, ext in enumerate(index.exts)}
+        view = memoryview(data)
+        for column, count in ((index.dir_mtimes, n_dirs), (index.file_dirs, n_files),
+                              (index.file_exts, n_files), (index.sizes, n_files), (index.mtimes, n_files)):
+            end = offset + count * column.itemsize
+            if end > len(data):
+                raise ValueError("Índice de carpeta truncado")
+            column.frombytes(view[offset:end])
+            if big_endian != (sys.byteorder == 'big'):
+                column.byteswap()
+            offset = end
+        index.digests = bytearray(view[offset:offset + n_files * DIGEST_SIZE])
+        if len(index.digests) != n_files * DIGEST_SIZE:
+            raise ValueError("Índice de carpeta truncado")
+        return index
+
+
+class IndexStore:
+    """Guarda en disco los índices de las carpetas usadas recientemente.
+
+    Cada carpeta tiene su propio archivo, de modo que cargar una no obliga
+    a leer las demás; al guardar se conservan solo los max_folders índices
+    usados más recientemente.
+    """
+
+    def __init__(self, directory, max_folders=8):
+        self.directory = directory
+        self.max_folders = max_folders
+
+    def _path(self, folder):
+        key = os.path.normcase(os.path.abspath(folder)).encode('utf-8', 'surrogateescape')
+        return os.path.join(self.directory, hashlib.blake2b(key, digest_size=8).hexdigest() + ".idx")
+
+    def load(self, folder):
+        """Devuelve el índice guardado de la carpeta o None si no hay uno válido"""
+        path = self._path(folder)
+        try:
+            with open(path, 'rb') as f:
+                index = FolderIndex.from_bytes(f.read())
+            os.utime(path)   # marcar como usado recientemente
+        except (OSError, ValueError):
+            return None
+        if os.path.normcase(index.folder) != os.path.normcase(os.path.abspath(folder)):
+            return None
+        return index
+
+    def save(self, index):
+        """Guarda el índice (de forma atómica) y descarta los menos usados"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(index.folder)
+        temp_path = path + ".tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(index.to_bytes())
+        os.replace(temp_path, path)
+
+        stored = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".idx"):
+                try:
+                    stored.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    pass
+        stored.sort(reverse=True)
+        for _, old_path in stored[self.max_folders:]:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+    def refresh(self, folder, workers=DEFAULT_WORKERS, ctx=None):
+        """Carga el índice de la carpeta (o uno vacío), lo actualiza y lo guarda"""
+        index = self.load(folder) or FolderIndex(folder)
+        index.refresh(workers, ctx)
+        self.save(index)
+        return index
+
+
+def format_preview(preview, top=5):
+    """Texto breve con el resumen de la vista previa de una carpeta"""
+    mb = 1024 * 1024
+    by_count = sorted(preview.extensions.items(), key=lambda item: (-item[1][0], item[0]))
+    extensions = ", ".join(f"{ext or 'sin extensión'} {count}" for ext, (count, _) in by_count[:top])
+    if len(by_count) > top:
+        extensions += f" y {len(by_count) - top} más"
+    text = f"{preview.files} archivos ({preview.total_bytes / mb:.1f} MB)"
+    if extensions:
+        text += f": {extensions}"
+    return (f"{text}. {preview.duplicate_groups} grupos de duplicados previstos "
+            f"({preview.duplicate_files} archivos, {preview.duplicate_bytes / mb:.1f} MB); "
+            f"{preview.temp_files} temporales ({preview.temp_bytes / mb:.1f} MB)")
@@ -0,0 +1,248 @@
+"""Pipelines de tareas y scripts definidos en saved_scripts"""
+import os
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from autotask_engine import (TaskContext, TASKS, run_task, scan_files, DEFAULT_WORKERS,
+                             HASH_CACHE_FILE, TEMP_EXTENSIONS, CLEAN_PRUNE_DIRS)
+from autotask_scripts import ScriptScheduler, ScriptJob, script_command
+
+# Estados de un paso del pipeline
+COMPLETED = "completado"
+SKIPPED = "sin cambios"
+FAILED = "fallido"
+BLOCKED = "bloqueado"
+CANCELLED = "cancelado"
+
+
+def folder_fingerprint(folder):
+    """Huella del contenido de un árbol: rutas, tamaños y fechas de modificación"""
+    hasher = hashlib.blake2b(digest_size=16)
+    entries = sorted((os.path.relpath(entry.path, folder), entry.size, entry.mtime_ns)
+                     for entry in scan_files(folder, recursive=True))
+    for rel_path, size, mtime_ns in entries:
+        hasher.update(f"{rel_path}\0{size}\0{mtime_ns}\n".encode('utf-8', 'surrogateescape'))
+    return hasher.hexdigest()
+
+
+def normalize_steps(saved_scripts):
+    """Convierte saved_scripts en una lista de pasos con nombre y dependencias.
+
+    Cada elemento puede ser la ruta de un script o un diccionario con
+    "task" (rename, organize, dedupe, clean) o "script", y opcionalmente
+    "name", "depends", "options" y "timeout". Un paso sin "depends" depende
+    del anterior, de modo que una lista simple se ejecuta en orden; con
+    "depends": [] el paso puede ejecutarse en paralelo con los demás.
+    """
+    steps = []
+    previous = None
+    for i, item in enumerate(saved_scripts):
+        step = {'script': item} if isinstance(item, str) else dict(item)
+        if 'task' in step:
+            if step['task'] not in TASKS:
+                raise ValueError(f"Tarea desconocida en el pipeline: {step['task']}")
+        elif 'script' not in step:
+            raise ValueError(f"El paso {i + 1} del pipeline no tiene 'task' ni 'script'")
+        step.setdefault('name', step.get('task') or os.path.basename(step['script']))
+        if 'depends' not in step:
+            step['depends'] = [previous] if previous else []
+        previous = step['name']
+        steps.append(step)
+
+    names = [step['name'] for step in steps]
+    if len(set(names)) != len(names):
+        raise ValueError("Los nombres de los pasos del pipeline deben ser únicos")
+    for step in steps:
+        for dependency in step['depends']:
+            if dependency not in names:
+                raise ValueError(f"El paso {step['name']} depende de un paso inexistente: {dependency}")
+
+    # Detectar ciclos (orden topológico)
+    remaining = {step['name']: set(step['depends']) for step in steps}
+    while remaining:
+        ready = [name for name, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"El pipeline tiene dependencias circulares: {', '.join(sorted(remaining))}")
+        for name in ready:
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return steps
+
+
+def step_signature(step, options=None):
+    """Identifica la definición de un paso (y la versión del script, si lo hay)"""
+    signature = json.dumps([step, options], sort_keys=True)
+    if 'script' in step:
+        try:
+            st = os.stat(step['script'])
+            signature += f"|{st.st_size}|{st.st_mtime_ns}"
+        except OSError:
+            pass
+    return hashlib.blake2b(signature.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class Pipeline:
+    """Ejecuta los pasos de un pipeline respetando sus dependencias.
+
+    Los pasos cuyas dependencias ya terminaron se ejecutan en paralelo
+    (hasta max_parallel a la vez), salvo las tareas integradas: todas
+    trabajan sobre la misma carpeta y se ejecutan de una en una, como en
+    TaskManager; solo los scripts corren en paralelo con otros pasos. Antes de cada paso se calcula la huella
+    de la carpeta; si coincide con la registrada tras la última ejecución
+    correcta del mismo paso (y su definición no cambió), el paso se omite.
+    Al terminar, los pasos completados registran la huella final de la
+    carpeta, de modo que una segunda ejecución sin cambios no repite nada.
+    state es un diccionario {paso: {...}} que se actualiza para guardarlo
+    entre ejecuciones. task_defaults indica las opciones de cada tarea que
+    el paso no fije.
+    """
+
+    def __init__(self, steps, folder, state=None, max_parallel=4, scripts=None,
+                 script_timeout=300, task_defaults=None, dry_run=False, force=False, ctx=None):
+        self.steps = normalize_steps(steps)
+        self.folder = folder
+        self.state = state if state is not None else {}
+        self.task_defaults = task_defaults or {}
+        self.dry_run = dry_run
+        self.max_parallel = max(1, max_parallel)
+        self.ctx = ctx or TaskContext()
+        self.scripts = scripts or ScriptScheduler(max_concurrent=self.max_parallel, ctx=self.ctx)
+        self.script_timeout = script_timeout
+        self.force = force
+        self.results = {}
+        self.task_lock = threading.Lock()
+
+    def _run_step(self, step):
+        if 'task' not in step or self.dry_run:
+            return self._execute_step(step)
+        # Una tarea integrada a la vez sobre la carpeta (la huella se calcula ya con el turno)
+        while not self.task_lock.acquire(timeout=0.2):
+            if self.ctx.cancelled:
+                return CANCELLED
+        try:
+            return self._execute_step(step)
+        finally:
+            self.task_lock.release()
+
+    def _execute_step(self, step):
+        options = None
+        if 'task' in step:
+            options = dict(self.task_defaults.get(step['task'], {}))
+            options.update(step.get('options', {}))
+            options['dry_run'] = self.dry_run
+        elif self.dry_run:
+            self.ctx.log(f"[Simulación] Se ejecutaría el script: {step['script']}")
+            return COMPLETED
+        signature = step_signature(step, options)
+        before = folder_fingerprint(self.folder)
+        previous = self.state.get(step['name'])
+        if (not self.force and previous and previous.get('signature') == signature
+                and previous.get('fingerprint') == before):
+            self.ctx.log(f"Paso omitido (sin cambios desde la última ejecución): {step['name']}")
+            return SKIPPED
+
+        self.ctx.log(f"Pipeline: iniciando paso {step['name']}")
+        if 'task' in step:
+            # Contexto propio por paso: las métricas de pasos en paralelo no se mezclan
+            ok = run_task(step['task'], self.folder, self.ctx.child(), **options) is not None
+        else:
+            job = self.scripts.submit(script_command(step['script']), cwd=self.folder,
+                                      name=step['name'],
+                                      timeout=step.get('timeout', self.script_timeout),
+                                      warm=step.get('warm', False))
+            while not job.wait(0.2):
+                if self.ctx.cancelled:
+                    job.cancel()
+            ok = job.status == ScriptJob.SUCCEEDED
+        if not ok:
+            return CANCELLED if self.ctx.cancelled else FAILED
+        if not self.dry_run:
+            self.state[step['name']] = {'signature': signature}
+        return COMPLETED
+
+    def run(self):
+        """Ejecuta el pipeline y devuelve {paso: estado}"""
+        pending = {step['name']: step for step in self.steps}
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_parallel) as executor:
+            while pending or running:
+                if self.ctx.cancelled:
+                    # No lanzar más pasos; los que están en marcha atienden la cancelación
+                    for name in pending:
+                        self.results[name] = CANCELLED
+                    pending.clear()
+                for name, step in list(pending.items()):
+                    statuses = [self.results.get(dep) for dep in step['depends']]
+                    if any(status in (FAILED, BLOCKED, CANCELLED) for status in statuses):
+                        self.results[name] = BLOCKED
+                        del pending[name]
+                        self.ctx.log(f"Paso bloqueado por una dependencia fallida: {name}", "warning")
+                    elif all(status in (COMPLETED, SKIPPED) for status in statuses):
+                        del pending[name]
+                        running[executor.submit(self._run_step, step)] = name
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        self.results[name] = future.result()
+                    except Exception as e:
+                        self.ctx.log(f"Error en el paso {name}: {str(e)}", "error")
+                        self.results[name] = FAILED
+
+        completed = [name for name, status in self.results.items() if status == COMPLETED]
+        if completed and not self.dry_run:
+            fingerprint = folder_fingerprint(self.folder)
+            for name in completed:
+                if name in self.state:
+                    self.state[name]['fingerprint'] = fingerprint
+
+        counts = {}
+        for status in self.results.values():
+            counts[status] = counts.get(status, 0) + 1
+        summary = ", ".join(f"{count} {status}" for status, count in counts.items())
+        failed = counts.get(FAILED, 0) + counts.get(BLOCKED, 0)
+        if self.ctx.cancelled:
+            self.ctx.log(f"Pipeline cancelado: {summary}", "warning")
+        else:
+            self.ctx.log(f"Pipeline finalizado: {summary}", "error" if failed else "success")
+        return self.results
+
+
+def task_defaults_from_config(config, base_dir="."):
+    """Opciones de las tareas según la configuración guardada de AutoTask"""
+    cache_path = None
+    if config.get('hash_cache', True):
+        cache_path = os.path.join(os.path.abspath(base_dir), HASH_CACHE_FILE)
+    return {
+        'clean': {
+            'extensions': config.get('clean_extensions', list(TEMP_EXTENSIONS)),
+            'patterns': config.get('clean_patterns', []),
+            'min_age_days': config.get('clean_min_age_days'),
+            'min_size': config.get('clean_min_size'),
+            'max_size': config.get('clean_max_size'),
+            'prune': config.get('clean_prune', list(CLEAN_PRUNE_DIRS)),
+            'workers': max(1, int(config.get('clean_workers', 1))),
+        },
+        'organize': {'workers': max(1, int(config.get('move_workers', DEFAULT_WORKERS)))},
+        'dedupe': {
+            'recursive': bool(config.get('dedupe_recursive', False)),
+            'include': config.get('dedupe_include', []),
+            'exclude': config.get('dedupe_exclude', []),
+            'max_depth': config.get('dedupe_max_depth'),
+            'algorithm': config.get('hash_algorithm', "md5"),
+            'workers': max(1, int(config.get('hash_workers', DEFAULT_WORKERS))),
+            'cache_path': cache_path,
+            'verify': bool(config.get('dedupe_verify', False)),
+            'mode': config.get('dedupe_mode', 'delete'),
+        },
+    }
+
+
+def folder_state(config, folder):
+    """Estado guardado de los pasos del pipeline para una carpeta (se crea si no existe)"""
+    return config.setdefault('pipeline_state', {}).setdefault(os.path.abspath(folder), {})
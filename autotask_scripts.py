@@ -0,0 +1,507 @@
+"""Ejecución concurrente de scripts de AutoTask"""
+import io
+import os
+import sys
+import json
+import time
+import queue
+import runpy
+import importlib
+import traceback
+import itertools
+import threading
+import subprocess
+from collections import deque
+
+from autotask_engine import TaskContext
+
+# Rutas habituales de AutoHotkey en Windows
+AHK_PATHS = [
+    "C:\\Program Files\\AutoHotkey\\AutoHotkey.exe",
+    "C:\\Program Files (x86)\\AutoHotkey\\AutoHotkey.exe"
+]
+# Longitud máxima de una línea de salida (las más largas se parten)
+MAX_LINE_LENGTH = 64 * 1024
+
+
+def find_autohotkey():
+    """Devuelve la ruta del ejecutable de AutoHotkey o None si no está instalado"""
+    for path in AHK_PATHS:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def script_command(script_path):
+    """Construye la línea de comandos para ejecutar un script según su extensión"""
+    ext = os.path.splitext(script_path)[1].lower()
+    if ext == '.py':
+        return [sys.executable, script_path]
+    if ext == '.ahk':
+        ahk_path = find_autohotkey()
+        if not ahk_path:
+            raise FileNotFoundError("AutoHotkey no está instalado o no se pudo encontrar.")
+        return [ahk_path, script_path]
+    return [script_path]
+
+
+class ScriptJob:
+    """Un script en la cola: estado, últimas líneas de salida y resultado"""
+
+    PENDING = "pendiente"
+    RUNNING = "ejecutando"
+    SUCCEEDED = "completado"
+    FAILED = "con errores"
+    TIMED_OUT = "tiempo agotado"
+    CANCELLED = "cancelado"
+
+    def __init__(self, job_id, command, cwd, name, timeout, max_output_lines, warm=False):
+        self.id = job_id
+        self.command = command
+        self.warm = warm
+        self.cwd = cwd
+        self.name = name
+        self.timeout = timeout
+        self.status = self.PENDING
+        self.returncode = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        # Solo se conservan las últimas líneas de cada flujo
+        self.stdout = deque(maxlen=max_output_lines)
+        self.stderr = deque(maxlen=max_output_lines)
+        self.cancel_event = threading.Event()
+        self.done_event = threading.Event()
+
+    @property
+    def duration(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def cancel(self):
+        """Solicita cancelar el trabajo (pendiente o en ejecución)"""
+        self.cancel_event.set()
+
+    def wait(self, timeout=None):
+        """Espera a que el trabajo termine"""
+        return self.done_event.wait(timeout)
+
+    def summary(self):
+        """Una línea con el resultado del trabajo para el historial"""
+        started = time.strftime("%H:%M:%S", time.localtime(self.started or self.submitted))
+        code = "" if self.returncode is None else f" (código {self.returncode})"
+        return f"{started} #{self.id} {self.name}: {self.status}{code} en {self.duration:.2f} s"
+
+
+class ScriptScheduler:
+    """Cola de scripts con un límite de ejecuciones simultáneas.
+
+    La salida de cada proceso se lee línea a línea a medida que se produce
+    (Popen con tuberías) y se envía al registro; en memoria solo se guardan
+    las últimas max_output_lines líneas de cada flujo. Cada trabajo tiene su
+    propio tiempo máximo y puede cancelarse. Los trabajos terminados quedan
+    en un historial acotado. Con un PythonWorkerPool, los scripts Python
+    marcados como warm se ejecutan en procesos ya arrancados.
+    """
+
+    def __init__(self, max_concurrent=2, max_output_lines=1000, history_size=100,
+                 python_pool=None, ctx=None):
+        self.max_concurrent = max(1, max_concurrent)
+        self.python_pool = python_pool
+        self.max_output_lines = max_output_lines
+        self.ctx = ctx or TaskContext()
+        self.queue = queue.Queue()
+        self.jobs = {}
+        self.history = deque(maxlen=history_size)
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.workers = []
+
+    def submit(self, command, cwd=None, name=None, timeout=300, warm=False):
+        """Encola un comando y devuelve su ScriptJob.
+
+        Con warm, un comando [sys.executable, script, *args] se ejecuta en el
+        pool de procesos precargados si el planificador tiene uno.
+        """
+        if name is None:
+            # Nombre del script (el primer elemento suele ser el intérprete)
+            name = os.path.basename(command[1] if len(command) > 1 else command[0])
+        job = ScriptJob(next(self.ids), command, cwd, name, timeout, self.max_output_lines, warm)
+        with self.lock:
+            self.jobs[job.id] = job
+            queued = len(self.jobs) > self.max_concurrent
+            # Los hilos de ejecución se crean bajo demanda hasta el límite
+            if len(self.workers) < self.max_concurrent:
+                worker = threading.Thread(target=self._worker, daemon=True)
+                self.workers.append(worker)
+                worker.start()
+        if queued:
+            self.ctx.log(f"Script en cola: {job.name} (#{job.id})")
+        self.queue.put(job)
+        return job
+
+    def active_jobs(self):
+        """Trabajos pendientes o en ejecución"""
+        with self.lock:
+            return list(self.jobs.values())
+
+    def recent_history(self, limit=10, name=None):
+        """Últimos trabajos terminados, del más reciente al más antiguo.
+
+        Con name solo se devuelven los de ese script.
+        """
+        with self.lock:
+            jobs = [job for job in reversed(self.history) if name is None or job.name == name]
+        return jobs[:limit] if limit else jobs
+
+    def cancel(self, job_id=None):
+        """Cancela un trabajo por id, o todos los activos si no se indica"""
+        for job in self.active_jobs():
+            if job_id is None or job.id == job_id:
+                job.cancel()
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            try:
+                self._run(job)
+            except Exception as e:
+                job.status = ScriptJob.FAILED
+                self.ctx.log(f"Error ejecutando el script: {str(e)}", "error")
+            finally:
+                job.finished = job.finished or time.time()
+                with self.lock:
+                    self.jobs.pop(job.id, None)
+                    self.history.append(job)
+                job.done_event.set()
+
+    def _read_stream(self, job, stream, lines, message_type):
+        for line in iter(lambda: stream.readline(MAX_LINE_LENGTH), ''):
+            line = line.rstrip('\r\n')
+            lines.append(line)
+            self.ctx.log(f"  [{job.name}] {line}", message_type)
+        stream.close()
+
+    def _wait(self, job, is_done, kill):
+        """Espera a que termine un trabajo atendiendo a la cancelación y al tiempo máximo"""
+        deadline = job.started + job.timeout if job.timeout else None
+        while not is_done(0.2):
+            if job.cancel_event.is_set():
+                job.status = ScriptJob.CANCELLED
+            elif deadline and time.time() > deadline:
+                job.status = ScriptJob.TIMED_OUT
+            else:
+                continue
+            kill()
+            return False
+        return True
+
+    def _run_process(self, job):
+        """Ejecuta el trabajo en un proceso nuevo y devuelve el código de salida"""
+        process = subprocess.Popen(
+            job.command, cwd=job.cwd, stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            text=True, errors='replace', bufsize=1
+        )
+        readers = [
+            threading.Thread(target=self._read_stream, args=(job, process.stdout, job.stdout, "info"),
+                             daemon=True),
+            threading.Thread(target=self._read_stream, args=(job, process.stderr, job.stderr, "error"),
+                             daemon=True),
+        ]
+        for reader in readers:
+            reader.start()
+
+        def is_done(timeout):
+            try:
+                process.wait(timeout=timeout)
+                return True
+            except subprocess.TimeoutExpired:
+                return False
+
+        def kill():
+            process.kill()
+            process.wait()
+
+        self._wait(job, is_done, kill)
+        for reader in readers:
+            # Un proceso hijo huérfano podría mantener la tubería abierta
+            reader.join(5)
+        return process.returncode
+
+    def _run_warm(self, job):
+        """Ejecuta el trabajo en un proceso precargado del pool y devuelve el código de salida"""
+        def on_output(stream, line):
+            lines, message_type = (job.stdout, "info") if stream == 'out' else (job.stderr, "error")
+            lines.append(line)
+            self.ctx.log(f"  [{job.name}] {line}", message_type)
+
+        worker = self.python_pool.acquire()
+        try:
+            worker.send(job.command[1], job.cwd, job.command[2:])
+            self._wait(job, lambda timeout: worker.poll(on_output, timeout), worker.kill)
+        finally:
+            self.python_pool.release(worker)
+        return worker.returncode
+
+    def _run(self, job):
+        if job.cancel_event.is_set():
+            job.status = ScriptJob.CANCELLED
+            self.ctx.log(f"Script cancelado antes de empezar: {job.name}", "warning")
+            return
+
+        job.status = ScriptJob.RUNNING
+        job.started = time.time()
+        self.ctx.log(f"Ejecutando script: {job.name} (#{job.id})")
+        if job.warm and self.python_pool is not None:
+            job.returncode = self._run_warm(job)
+        else:
+            job.returncode = self._run_process(job)
+        job.finished = time.time()
+
+        if job.status == ScriptJob.CANCELLED:
+            self.ctx.log(f"Script cancelado: {job.name}", "warning")
+        elif job.status == ScriptJob.TIMED_OUT:
+            self.ctx.log(f"El script {job.name} excedió el tiempo máximo de ejecución "
+                         f"({job.timeout:g} segundos).", "error")
+        elif job.returncode == 0:
+            job.status = ScriptJob.SUCCEEDED
+            self.ctx.log(f"Script {job.name} ejecutado exitosamente en {job.duration:.2f} s. "
+                         f"Código de salida: {job.returncode}", "success")
+        else:
+            job.status = ScriptJob.FAILED
+            self.ctx.log(f"Script {job.name} finalizado con errores. "
+                         f"Código de salida: {job.returncode}", "error")
+
+
+class _LineWriter(io.TextIOBase):
+    """Flujo de texto del proceso de trabajo que envía cada línea al proceso principal"""
+
+    def __init__(self, stream, send):
+        self.stream = stream
+        self.send = send
+        self.buffer = ""
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        self.buffer += text
+        if "\n" in self.buffer:
+            *lines, self.buffer = self.buffer.split("\n")
+            for line in lines:
+                self.send({'stream': self.stream, 'line': line.rstrip('\r')})
+        return len(text)
+
+    def flush(self):
+        if self.buffer:
+            self.send({'stream': self.stream, 'line': self.buffer})
+            self.buffer = ""
+
+
+def worker_main(preload=()):
+    """Bucle del proceso de trabajo precargado.
+
+    Lee órdenes JSON (una por línea) de la entrada estándar y ejecuta cada
+    script con runpy en un espacio de nombres nuevo, con la carpeta de
+    trabajo y sys.argv del trabajo. Al terminar se restauran sys.path,
+    sys.argv y la carpeta de trabajo, y se descargan los módulos que importó
+    el script (los precargados se mantienen). La salida del script se
+    reenvía línea a línea como JSON y al final se envía el código de salida.
+    """
+    # Canal de control propio; el script no puede leerlo ni escribir en él
+    commands = os.fdopen(os.dup(0), 'r', encoding='utf-8')
+    protocol = os.fdopen(os.dup(1), 'w', encoding='utf-8')
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(2, 1)
+    lock = threading.Lock()
+
+    def send(message):
+        with lock:
+            protocol.write(json.dumps(message) + "\n")
+            protocol.flush()
+
+    for module in preload:
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            send({'stream': 'err', 'line': f"No se pudo precargar {module}: {str(e)}"})
+    send({'ready': True})
+
+    for command in commands:
+        job = json.loads(command)
+        saved_path = list(sys.path)
+        saved_argv = list(sys.argv)
+        saved_modules = set(sys.modules)
+        saved_cwd = os.getcwd()
+        sys.stdout = _LineWriter('out', send)
+        sys.stderr = _LineWriter('err', send)
+        code = 0
+        try:
+            if job['cwd']:
+                os.chdir(job['cwd'])
+            sys.argv = [job['script']] + job['args']
+            sys.path.insert(0, os.path.dirname(os.path.abspath(job['script'])))
+            runpy.run_path(job['script'], run_name="__main__")
+        except SystemExit as e:
+            if e.code is None:
+                code = 0
+            elif isinstance(e.code, int):
+                code = e.code
+            else:
+                print(e.code, file=sys.stderr)
+                code = 1
+        except BaseException:
+            # Mostrar la traza a partir del propio script, sin los marcos de runpy
+            error_type, error, tb = sys.exc_info()
+            script = os.path.abspath(job['script'])
+            first = tb
+            while first is not None and os.path.abspath(first.tb_frame.f_code.co_filename) != script:
+                first = first.tb_next
+            traceback.print_exception(error_type, error, first or tb)
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+            sys.path[:] = saved_path
+            sys.argv = saved_argv
+            # Los módulos que importó el script no pasan al siguiente (dos scripts
+            # pueden tener un helper.py propio); los precargados se conservan
+            for name in [name for name in sys.modules if name not in saved_modules]:
+                del sys.modules[name]
+            os.chdir(saved_cwd)
+        send({'exit': code})
+
+
+class PythonWorker:
+    """Proceso Python precargado del pool"""
+
+    def __init__(self, preload):
+        self.runs = 0
+        self.returncode = None
+        self.messages = queue.Queue()
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--worker'] + list(preload),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            text=True, encoding='utf-8', errors='replace', bufsize=1
+        )
+        self.reader = threading.Thread(target=self._read, daemon=True)
+        self.reader.start()
+
+    def _read(self):
+        for line in self.process.stdout:
+            try:
+                self.messages.put(json.loads(line))
+            except ValueError:
+                continue
+        self.messages.put(None)
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    def send(self, script, cwd, args):
+        """Envía un script al proceso para ejecutarlo"""
+        self.returncode = None
+        self.process.stdin.write(json.dumps({'script': script, 'cwd': cwd, 'args': args}) + "\n")
+        self.process.stdin.flush()
+
+    def poll(self, on_output, timeout):
+        """Atiende los mensajes del proceso; devuelve True cuando el script ha terminado"""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                message = self.messages.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                return False
+            if message is None:
+                # El proceso terminó de forma inesperada
+                self.returncode = self.process.wait()
+                return True
+            if 'exit' in message:
+                self.runs += 1
+                self.returncode = message['exit']
+                return True
+            if 'stream' in message:
+                on_output(message['stream'], message['line'])
+
+    def kill(self):
+        self.process.kill()
+        self.process.wait()
+        self.returncode = self.process.returncode
+
+    def close(self):
+        if self.alive:
+            self.process.stdin.close()
+            try:
+                self.process.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                self.kill()
+
+
+class PythonWorkerPool:
+    """Pool de procesos Python arrancados de antemano para ejecutar scripts.
+
+    Evita el coste de arrancar el intérprete (y de importar los módulos de
+    preload) en cada ejecución. Cada proceso se recicla tras max_runs
+    ejecuciones o cuando un script termina con error, se cancela o agota su
+    tiempo, y se arranca otro en segundo plano para mantener el pool lleno.
+    La salida que los scripts escriban directamente en los descriptores del
+    sistema (por ejemplo procesos hijos) no se captura.
+    """
+
+    def __init__(self, size=2, preload=(), max_runs=50):
+        self.size = max(1, size)
+        self.preload = list(preload)
+        self.max_runs = max_runs
+        self.idle = []
+        self.lock = threading.Lock()
+        self.closed = False
+        for _ in range(self.size):
+            self._spawn_async()
+
+    def _spawn_async(self):
+        def spawn():
+            worker = PythonWorker(self.preload)
+            with self.lock:
+                if not self.closed and len(self.idle) < self.size:
+                    self.idle.append(worker)
+                    return
+            worker.close()
+        threading.Thread(target=spawn, daemon=True).start()
+
+    def acquire(self):
+        """Obtiene un proceso libre (o arranca uno si no hay ninguno listo)"""
+        with self.lock:
+            while self.idle:
+                worker = self.idle.pop()
+                if worker.alive:
+                    return worker
+        return PythonWorker(self.preload)
+
+    def release(self, worker):
+        """Devuelve un proceso al pool o lo recicla si ya no es reutilizable"""
+        reusable = (worker.alive and worker.returncode == 0 and worker.runs < self.max_runs)
+        if reusable:
+            with self.lock:
+                if not self.closed and len(self.idle) < self.size:
+                    self.idle.append(worker)
+                    return
+        worker.close()
+        if not self.closed:
+            self._spawn_async()
+
+    def close(self):
+        """Detiene todos los procesos libres"""
+        with self.lock:
+            self.closed = True
+            idle, self.idle = self.idle, []
+        for worker in idle:
+            worker.close()
+
+
+if __name__ == "__main__" and sys.argv[1:2] == ['--worker']:
+    worker_main(sys.argv[2:])
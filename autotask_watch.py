@@ -0,0 +1,360 @@
+"""Vigilancia incremental de carpetas de AutoTask"""
+import os
+import time
+import threading
+
+from autotask_engine import (TaskContext, FileEntry, Plan, JOURNAL_DIR, DEFAULT_TEMP_MATCHER,
+                             CLEAN_PRUNE_DIRS, Journal, TaskCancelled, apply_plan, plan_organize, hash_file,
+                             compile_patterns)
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+# Acciones que puede aplicar la vigilancia a los archivos nuevos, en orden
+WATCH_ACTIONS = ('clean', 'dedupe', 'organize')
+
+
+class _DirtyHandler(FileSystemEventHandler):
+    """Marca como pendientes de releer las carpetas afectadas por cada evento"""
+
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        for path in (event.src_path, getattr(event, 'dest_path', None)):
+            if path:
+                self.watcher.mark_dirty(os.path.dirname(path))
+                if event.is_directory:
+                    self.watcher.mark_dirty(path)
+
+
+class FolderWatcher:
+    """Vigila una carpeta y aplica las tareas solo a los archivos nuevos o modificados.
+
+    Mantiene en memoria un índice de los archivos del árbol (tamaño, mtime)
+    y la fecha de modificación de cada carpeta. Con el paquete watchdog las
+    notificaciones del sistema (inotify, ReadDirectoryChangesW, FSEvents)
+    indican qué carpetas releer; sin él, en cada intervalo solo se compara
+    el mtime de las carpetas conocidas y se releen las que cambiaron. Un
+    archivo nuevo se procesa cuando su tamaño y mtime se mantienen estables
+    durante settle segundos, para no tocar archivos que aún se están copiando.
+    Los temporales se reconocen con matcher (un TempMatcher) y las carpetas
+    que coinciden con prune no se indexan ni se vigilan, igual que en la
+    limpieza. Con ctx.journal todas las operaciones de la sesión de
+    vigilancia se registran en una sola ejecución del diario de deshacer,
+    que se cierra al detenerla. Con tasks (un TaskManager) cada lote se
+    aplica en el turno de la carpeta, sin mezclarse con otras tareas que
+    trabajen sobre ella.
+    """
+
+    def __init__(self, folder, actions=WATCH_ACTIONS, interval=2.0, settle=1.0,
+                 algorithm="md5", matcher=None, prune=CLEAN_PRUNE_DIRS, tasks=None, ctx=None):
+        self.folder = os.path.abspath(folder)
+        self.actions = set(actions)
+        self.matcher = matcher or DEFAULT_TEMP_MATCHER
+        self.prune_re = compile_patterns(prune)
+        self.interval = interval
+        self.settle = settle
+        self.algorithm = algorithm
+        self.ctx = ctx or TaskContext()
+        self.tasks = tasks
+        self.dir_files = {}    # carpeta -> {nombre: FileEntry}
+        self.dir_mtimes = {}   # carpeta -> st_mtime_ns
+        self.by_size = {}      # tamaño -> set de rutas (índice de duplicados)
+        self.digests = {}      # ruta -> hash completo, calculado bajo demanda
+        self.pending = {}      # ruta -> instante del último cambio observado
+        self.dirty = set()
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.observer = None
+        self.journal = None
+
+    # --- Índice ---
+
+    def _add(self, entry):
+        directory = os.path.dirname(entry.path)
+        self.dir_files.setdefault(directory, {})[entry.name] = entry
+        self.by_size.setdefault(entry.size, set()).add(entry.path)
+
+    def _remove(self, path):
+        directory, name = os.path.split(path)
+        entry = self.dir_files.get(directory, {}).pop(name, None)
+        if entry is not None:
+            paths = self.by_size.get(entry.size)
+            if paths:
+                paths.discard(path)
+                if not paths:
+                    del self.by_size[entry.size]
+        self.digests.pop(path, None)
+        self.pending.pop(path, None)
+
+    def _forget_tree(self, directory):
+        """Elimina del índice una carpeta desaparecida y todo su contenido"""
+        prefix = directory + os.sep
+        for known in [d for d in self.dir_mtimes if d == directory or d.startswith(prefix)]:
+            for name in list(self.dir_files.get(known, {})):
+                self._remove(os.path.join(known, name))
+            self.dir_files.pop(known, None)
+            del self.dir_mtimes[known]
+
+    def _pruned(self, name):
+        return name == JOURNAL_DIR or (
+            self.prune_re is not None and self.prune_re.match(os.path.normcase(name)) is not None)
+
+    def _in_pruned_dir(self, directory):
+        """Indica si la carpeta está dentro de una carpeta podada"""
+        relative = os.path.relpath(directory, self.folder)
+        return relative != os.curdir and any(self._pruned(part) for part in relative.split(os.sep))
+
+    def _scan_dir(self, directory, initial=False):
+        """Relee una carpeta y registra los archivos nuevos o modificados"""
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+            it = os.scandir(directory)
+        except OSError:
+            self._forget_tree(directory)
+            return
+        self.dir_mtimes[directory] = mtime
+        known = self.dir_files.setdefault(directory, {})
+        seen = set()
+        subdirs = []
+        now = time.monotonic()
+        with it:
+            for item in it:
+                try:
+                    if item.is_dir(follow_symlinks=False):
+                        if not self._pruned(item.name):
+                            subdirs.append(item.path)
+                        continue
+                    if not item.is_file(follow_symlinks=False):
+                        continue
+                    st = item.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                seen.add(item.name)
+                entry = FileEntry(item.path, item.name, st.st_size, st.st_mtime_ns,
+                                  st.st_ino or item.inode())
+                previous = known.get(item.name)
+                if previous == entry:
+                    continue
+                if previous is not None:
+                    self._remove(item.path)
+                self._add(entry)
+                if not initial:
+                    self.pending[item.path] = now
+
+        for name in [name for name in known if name not in seen]:
+            self._remove(os.path.join(directory, name))
+        prefix = directory + os.sep
+        present = set(subdirs)
+        for known_dir in [d for d in self.dir_mtimes
+                          if d.startswith(prefix) and os.sep not in d[len(prefix):]]:
+            if known_dir not in present:
+                self._forget_tree(known_dir)
+        for subdir in subdirs:
+            if subdir not in self.dir_mtimes:
+                self._scan_dir(subdir, initial)
+
+    def mark_dirty(self, directory):
+        """Solicita releer una carpeta (seguro desde cualquier hilo)"""
+        with self.lock:
+            self.dirty.add(directory)
+        self.wake.set()
+
+    def _changed_dirs(self):
+        if self.observer is not None:
+            with self.lock:
+                dirty, self.dirty = self.dirty, set()
+            return [d for d in dirty if d == self.folder or (
+                d.startswith(self.folder + os.sep) and not self._in_pruned_dir(d))]
+        # Sondeo: un stat por carpeta conocida en lugar de uno por archivo
+        changed = []
+        for directory, mtime in list(self.dir_mtimes.items()):
+            try:
+                if os.stat(directory).st_mtime_ns != mtime:
+                    changed.append(directory)
+            except OSError:
+                changed.append(directory)
+        return changed
+
+    # --- Procesamiento ---
+
+    def _digest(self, path):
+        digest = self.digests.get(path)
+        if digest is None:
+            digest = self.digests[path] = hash_file(path, self.algorithm)
+        return digest
+
+    def _find_original(self, entry):
+        """Busca en el índice un archivo ya asentado con el mismo contenido"""
+        candidates = [path for path in self.by_size.get(entry.size, ())
+                      if path != entry.path and path not in self.pending]
+        if not candidates:
+            return None
+        digest = self._digest(entry.path)
+        for path in candidates:
+            try:
+                if self._digest(path) == digest and os.path.exists(path):
+                    return path
+            except OSError:
+                self.digests.pop(path, None)
+        return None
+
+    def _entry(self, path):
+        directory, name = os.path.split(path)
+        return self.dir_files.get(directory, {}).get(name)
+
+    def process_pending(self):
+        """Aplica las acciones a los archivos nuevos que ya están estables"""
+        now = time.monotonic()
+        ready = sorted((seen, path) for path, seen in self.pending.items()
+                       if now - seen >= self.settle)
+        deletions = Plan('watch', self.folder)
+        to_organize = []
+        for seen, path in ready:
+            entry = self._entry(path)
+            del self.pending[path]
+            if entry is None:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                self._remove(path)
+                continue
+            if (st.st_size, st.st_mtime_ns) != (entry.size, entry.mtime_ns):
+                # Sigue cambiando: esperar a que se estabilice
+                self._remove(path)
+                self._add(entry._replace(size=st.st_size, mtime_ns=st.st_mtime_ns))
+                self.pending[path] = now
+                continue
+
+            if ('clean' in self.actions and self.matcher.match_name(entry.name)
+                    and self.matcher.match_stat(st)):
+                deletions.add('delete', path, size=entry.size, reason='temporal')
+                continue
+            if 'dedupe' in self.actions:
+                try:
+                    original = self._find_original(entry)
+                except OSError as e:
+                    self.ctx.log(f"No se pudo leer el archivo: {entry.name} ({str(e)})", "warning")
+                    original = None
+                if original:
+                    deletions.add('delete', path, original, entry.size, 'duplicado')
+                    continue
+            if 'organize' in self.actions and os.path.dirname(path) == self.folder:
+                to_organize.append(entry)
+
+        if not deletions and not to_organize:
+            return
+        if self.tasks is None:
+            self._apply(self.ctx, deletions, to_organize)
+            return
+        # El lote espera su turno como cualquier tarea sobre la carpeta; con una
+        # cancelación propia, cancelar las tareas no detiene la vigilancia
+        handle = self.tasks.submit("la vigilancia", self.folder,
+                                   lambda ctx: self._apply(ctx, deletions, to_organize),
+                                   self.ctx.child(threading.Event()))
+        while not handle.wait(0.2):
+            if self.stop_event.is_set():
+                handle.cancel()
+
+    def _apply(self, ctx, deletions, to_organize):
+        """Aplica los borrados y la organización de un lote y actualiza el índice"""
+        if ctx.journal and self.journal is None:
+            self.journal = Journal(self.folder, 'watch')
+        try:
+            if deletions:
+                apply_plan(deletions, ctx, journal=self.journal)
+                for operation in deletions:
+                    if not os.path.lexists(operation.source):
+                        self._remove(operation.source)
+            if to_organize:
+                plan = plan_organize(self.folder, files=to_organize, ctx=ctx)
+                apply_plan(plan, ctx, journal=self.journal)
+                for operation in plan:
+                    if operation.op != 'move' or os.path.lexists(operation.source):
+                        continue
+                    # Actualizar el índice para no tratar el archivo movido como nuevo
+                    digest = self.digests.get(operation.source)
+                    self._remove(operation.source)
+                    try:
+                        st = os.stat(operation.target)
+                    except OSError:
+                        continue
+                    self._add(FileEntry(operation.target, os.path.basename(operation.target),
+                                        st.st_size, st.st_mtime_ns, st.st_ino))
+                    if digest:
+                        self.digests[operation.target] = digest
+        except TaskCancelled:
+            # Las carpetas afectadas se releen en la próxima comprobación
+            ctx.log("Se canceló la vigilancia a mitad de un lote.", "warning")
+        finally:
+            if self.journal is not None:
+                # Cada lote queda en el disco: la sesión puede durar horas
+                self.journal.flush(sync=True)
+
+    def poll(self):
+        """Relee las carpetas que cambiaron y procesa los archivos pendientes"""
+        for directory in self._changed_dirs():
+            if directory in self.dir_mtimes or os.path.isdir(directory):
+                self._scan_dir(directory)
+        if self.pending:
+            self.process_pending()
+
+    # --- Ciclo de vida ---
+
+    def start(self):
+        """Inicia la vigilancia en un hilo en segundo plano"""
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Detiene la vigilancia y espera a que termine el hilo"""
+        self.stop_event.set()
+        self.wake.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def _run(self):
+        start = time.perf_counter()
+        self._scan_dir(self.folder, initial=True)
+        files = sum(len(names) for names in self.dir_files.values())
+        if Observer is not None:
+            self.observer = Observer()
+            self.observer.schedule(_DirtyHandler(self), self.folder, recursive=True)
+            self.observer.start()
+            mode = "notificaciones del sistema"
+        else:
+            mode = f"sondeo cada {self.interval:g} s"
+        self.ctx.log(f"Vigilancia iniciada en {self.folder}: {files} archivos indexados en "
+                     f"{time.perf_counter() - start:.2f} s ({mode})")
+        try:
+            while not self.stop_event.is_set():
+                timeout = self.interval
+                if self.pending:
+                    timeout = min(timeout, self.settle)
+                self.wake.wait(timeout)
+                self.wake.clear()
+                if self.stop_event.is_set():
+                    break
+                try:
+                    self.poll()
+                except Exception as e:
+                    self.ctx.log(f"Error durante la vigilancia: {str(e)}", "error")
+        finally:
+            if self.observer is not None:
+                self.observer.stop()
+                self.observer.join()
+                self.observer = None
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+            self.ctx.log("Vigilancia detenida.")
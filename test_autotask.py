@@ -0,0 +1,324 @@
+"""Pruebas de AutoTask (python -m unittest test_autotask)"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+import subprocess
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import autotask_engine
+from autotask_engine import FileEntry, TaskContext, TaskManager, compare_group, plan_rename, apply_plan
+from autotask_scripts import PythonWorker, ScriptScheduler, ScriptJob
+
+CLI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "autotask.py")
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def snapshot(folder):
+    """Contenido y número de enlaces de los archivos del árbol, sin el diario de deshacer"""
+    files = {}
+    for root, dirs, names in os.walk(folder):
+        dirs[:] = [d for d in dirs if d != ".autotask_deshacer"]
+        for name in names:
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                files[os.path.relpath(path, folder)] = (f.read(), os.stat(path).st_nlink)
+    return files
+
+
+class CompareGroupTest(unittest.TestCase):
+    """Comparación byte a byte de grupos del mismo tamaño, también por lotes"""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def entries(self, contents):
+        entries = []
+        for i, data in enumerate(contents):
+            path = os.path.join(self.folder, f"f{i:02d}")
+            write(path, data)
+            entries.append(FileEntry(path, f"f{i:02d}", len(data), 0, 0))
+        return entries
+
+    def names(self, groups):
+        return [[entry.name for entry in group] for group in groups]
+
+    def test_single_batch(self):
+        # Distintos solo en el último bloque o en el primero
+        entries = self.entries([b"aaaa" * 4, b"aaaa" * 3 + b"aaab", b"aaaa" * 4, b"baaa" * 4])
+        stats = {}
+        groups = compare_group(entries, chunk_size=4, stats=stats)
+        self.assertEqual(self.names(groups), [["f00", "f02"]])
+        self.assertEqual(stats['open'], 4)
+
+    def test_batches(self):
+        contents = [b"A", b"B", b"A", b"C", b"B", b"A", b"D", b"A", b"B", b"E"]
+        entries = self.entries([data * 8 for data in contents])
+        with mock.patch.object(autotask_engine, 'COMPARE_MAX_OPEN', 4):
+            groups = compare_group(entries, chunk_size=4)
+        self.assertEqual(self.names(groups), [["f00", "f02", "f05", "f07"], ["f01", "f04", "f08"]])
+
+    def test_singletons_merged_across_batches(self):
+        # Cada copia de X queda sola en su lote
+        contents = [b"X", b"A", b"B", b"C", b"D", b"E", b"F", b"X"]
+        entries = self.entries([data * 8 for data in contents])
+        with mock.patch.object(autotask_engine, 'COMPARE_MAX_OPEN', 4):
+            groups = compare_group(entries, chunk_size=4)
+        self.assertEqual(self.names(groups), [["f00", "f07"]])
+
+    def test_all_identical_across_batches(self):
+        entries = self.entries([b"igual" * 10] * 11)
+        with mock.patch.object(autotask_engine, 'COMPARE_MAX_OPEN', 3):
+            groups = compare_group(entries, chunk_size=8)
+        self.assertEqual(self.names(groups), [[entry.name for entry in entries]])
+
+    def test_all_different(self):
+        entries = self.entries([bytes([i]) * 8 for i in range(9)])
+        with mock.patch.object(autotask_engine, 'COMPARE_MAX_OPEN', 4):
+            self.assertEqual(compare_group(entries, chunk_size=4), [])
+
+
+class PlanRenameTest(unittest.TestCase):
+    """Renombrado con destinos que son el nombre actual de otro archivo"""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def rename(self, order):
+        """Planifica con los archivos en el orden indicado y aplica el plan"""
+        for name in order:
+            write(os.path.join(self.folder, name), name.encode())
+        list_files = autotask_engine.list_files
+
+        def ordered(*args):
+            return sorted(list_files(*args), key=lambda entry: order.index(entry.name))
+
+        with mock.patch.object(autotask_engine, 'list_files', ordered):
+            plan = plan_rename(self.folder)
+        apply_plan(plan)
+        return plan
+
+    def test_swap(self):
+        plan = self.rename(["documento_003.txt", "documento_002.txt", "documento_001.txt"])
+        # 003 y 001 se intercambian pasando por nombres temporales; 002 no se toca
+        self.assertEqual([op.reason for op in plan.operations].count('intermedio'), 2)
+        self.assertEqual(len(plan.operations), 4)
+        self.assertEqual(snapshot(self.folder), {
+            "documento_001.txt": (b"documento_003.txt", 1),
+            "documento_002.txt": (b"documento_002.txt", 1),
+            "documento_003.txt": (b"documento_001.txt", 1),
+        })
+
+    def test_cycle(self):
+        plan = self.rename(["documento_002.txt", "documento_003.txt", "documento_001.txt", "b.txt"])
+        temps = [op.target for op in plan.operations if op.reason == 'intermedio']
+        self.assertEqual(len(temps), 3)
+        # Ningún destino final se usa antes de que su archivo original lo haya dejado libre
+        self.assertEqual([op.source for op in plan.operations[-3:]], temps)
+        self.assertEqual(snapshot(self.folder), {
+            "documento_001.txt": (b"documento_002.txt", 1),
+            "documento_002.txt": (b"documento_003.txt", 1),
+            "documento_003.txt": (b"documento_001.txt", 1),
+            "documento_004.txt": (b"b.txt", 1),
+        })
+
+
+class TaskManagerTest(unittest.TestCase):
+    """Tareas sobre carpetas solapadas en serie; sobre carpetas independientes, a la vez"""
+
+    def setUp(self):
+        self.manager = TaskManager()
+        self.events = []
+        self.lock = threading.Lock()
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+
+    def blocking(self, name):
+        """Tarea que anota su inicio y fin y espera a que la prueba la libere"""
+        def func(ctx):
+            with self.lock:
+                self.events.append(("inicio", name))
+            self.release.wait(10)
+            with self.lock:
+                self.events.append(("fin", name))
+        return func
+
+    def started(self, name, timeout=5):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with self.lock:
+                if ("inicio", name) in self.events:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    def test_overlapping_folders_run_in_order(self):
+        base = tempfile.gettempdir()
+        first = self.manager.submit("a", base, self.blocking("a"))
+        second = self.manager.submit("b", os.path.join(base, "sub"), self.blocking("b"),
+                                     TaskContext(log=lambda *args: None))
+        third = self.manager.submit("c", base, self.blocking("c"), TaskContext(log=lambda *args: None))
+        self.assertTrue(self.started("a"))
+        # b (subcarpeta) y c (misma carpeta) esperan mientras a sigue en ejecución
+        self.assertFalse(self.started("b", timeout=0.5))
+        self.assertFalse(second.running)
+        self.release.set()
+        for handle in (first, second, third):
+            self.assertTrue(handle.wait(10))
+        self.assertEqual(self.events, [("inicio", "a"), ("fin", "a"), ("inicio", "b"), ("fin", "b"),
+                                       ("inicio", "c"), ("fin", "c")])
+        self.assertEqual(self.manager.active_tasks(), [])
+
+    def test_independent_folders_run_concurrently(self):
+        base = tempfile.gettempdir()
+        handles = [self.manager.submit(name, os.path.join(base, name), self.blocking(name))
+                   for name in ("x", "y")]
+        # Las dos empiezan sin que la otra haya terminado
+        self.assertTrue(self.started("x"))
+        self.assertTrue(self.started("y"))
+        self.release.set()
+        for handle in handles:
+            self.assertTrue(handle.wait(10))
+
+    def test_cancel_while_waiting(self):
+        base = tempfile.gettempdir()
+        first = self.manager.submit("a", base, self.blocking("a"))
+        second = self.manager.submit("b", base, self.blocking("b"), TaskContext(log=lambda *args: None))
+        self.assertTrue(self.started("a"))
+        self.manager.cancel(second)
+        self.assertTrue(second.wait(5))
+        self.release.set()
+        self.assertTrue(first.wait(10))
+        self.assertNotIn(("inicio", "b"), self.events)
+
+
+class UndoRelativePathTest(unittest.TestCase):
+    """Deshacer una tarea lanzada con la carpeta como ruta relativa"""
+
+    def setUp(self):
+        self.cwd = tempfile.mkdtemp()
+        self.folder = os.path.join(self.cwd, "t1")
+        for i in range(3):
+            write(os.path.join(self.folder, f"a{i}.txt"), b"duplicado")
+        write(os.path.join(self.folder, "b.txt"), b"unico")
+        write(os.path.join(self.folder, "c.tmp"), b"temporal")
+
+    def tearDown(self):
+        shutil.rmtree(self.cwd, ignore_errors=True)
+
+    def cli(self, *args):
+        return subprocess.run([sys.executable, CLI] + list(args), cwd=self.cwd,
+                              capture_output=True, text=True, encoding='utf-8')
+
+    def check_undo(self, *task):
+        before = snapshot(self.folder)
+        self.assertEqual(self.cli(*task, "t1").returncode, 0)
+        self.assertNotEqual(snapshot(self.folder), before)
+        undo = self.cli("undo", "t1")
+        self.assertEqual(undo.returncode, 0, undo.stdout)
+        self.assertNotIn("No se pudo deshacer", undo.stdout)
+        self.assertEqual(snapshot(self.folder), before)
+
+    def test_dedupe(self):
+        self.check_undo("dedupe", "--no-cache")
+
+    def test_dedupe_hardlink(self):
+        self.check_undo("dedupe", "--no-cache", "--mode", "hardlink")
+
+    def test_undo_hardlink_keeps_modified_file(self):
+        self.assertEqual(self.cli("dedupe", "--no-cache", "--mode", "hardlink", "t1").returncode, 0)
+        # a1.txt es ahora un enlace duro a a0.txt; el usuario lo reescribe
+        path = os.path.join(self.folder, "a1.txt")
+        os.remove(path)
+        write(path, b"datos nuevos")
+        undo = self.cli("undo", "t1")
+        self.assertIn("la ruta original está ocupada", undo.stdout)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b"datos nuevos")
+        # El otro duplicado sí se restaura como archivo independiente
+        self.assertEqual(os.stat(os.path.join(self.folder, "a2.txt")).st_nlink, 1)
+
+    def test_undo_hardlink_keeps_file_modified_in_place(self):
+        self.assertEqual(self.cli("dedupe", "--no-cache", "--mode", "hardlink", "t1").returncode, 0)
+        path = os.path.join(self.folder, "a1.txt")
+        with open(path, 'ab') as f:
+            f.write(b" editado")
+        undo = self.cli("undo", "t1")
+        self.assertIn("la ruta original está ocupada", undo.stdout)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b"duplicado editado")
+
+    def test_clean(self):
+        self.check_undo("clean")
+
+    def test_organize(self):
+        self.check_undo("organize")
+
+    def test_rename(self):
+        self.check_undo("rename")
+
+
+class WarmScriptsTest(unittest.TestCase):
+    """Scripts en procesos precargados: cada ejecución empieza limpia"""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_local_modules_do_not_leak(self):
+        worker = PythonWorker([])
+        output = []
+        try:
+            for name in ("a", "b"):
+                write(os.path.join(self.folder, name, "helper.py"), f"VALUE = '{name}'\n".encode())
+                script = os.path.join(self.folder, name, "s.py")
+                write(script, b"import sys, helper\nprint(helper.VALUE, sys.argv[1:])\n")
+                # Los dos scripts se ejecutan en el mismo proceso
+                worker.send(script, None, [name])
+                while not worker.poll(lambda stream, line: output.append(line), 10):
+                    pass
+                self.assertEqual(worker.returncode, 0, output)
+        finally:
+            worker.close()
+        self.assertEqual(output, ["a ['a']", "b ['b']"])
+
+
+class ScriptHistoryTest(unittest.TestCase):
+    """Historial de scripts terminados del planificador"""
+
+    def test_recent_history(self):
+        scheduler = ScriptScheduler(max_concurrent=1)
+        jobs = [scheduler.submit([sys.executable, "-c", f"raise SystemExit({code})"], name=name)
+                for name, code in (("uno", 0), ("dos", 3), ("uno", 0))]
+        for job in jobs:
+            self.assertTrue(job.wait(30))
+        history = scheduler.recent_history()
+        self.assertEqual([job.id for job in history], [3, 2, 1])
+        self.assertEqual([job.status for job in history],
+                         [ScriptJob.SUCCEEDED, ScriptJob.FAILED, ScriptJob.SUCCEEDED])
+        self.assertEqual([job.id for job in scheduler.recent_history(limit=2)], [3, 2])
+        self.assertEqual([job.id for job in scheduler.recent_history(name="uno")], [3, 1])
+        self.assertIn("dos: con errores (código 3)", history[1].summary())
+
+if __name__ == "__main__":
+    unittest.main()